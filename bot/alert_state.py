@@ -0,0 +1,89 @@
+import json
+import os
+from typing import Callable, Dict, Optional
+
+ALERT_STATE_FILE = "data/alert_state.json"
+DEFAULT_REARM_RATIO = 0.5 # 変動率が閾値のこの割合を下回ったら再通知可能にする
+
+class AlertStateTracker:
+    """
+    通知ごとの状態 (armed → fired → re-armed) を管理するエッジトリガー。
+    閾値を超えた瞬間に一度だけ発火し、変動率が 閾値×rearm_ratio を下回るまで再発火しません。
+
+    保存するのは fired 状態のキーのみ（キー -> 方向 +1/-1）で、無いキーは armed とみなします。
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.fired: Dict[str, int] = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.fired = {str(k): int(v) for k, v in json.load(f).items()}
+        except Exception as e:
+            print(f"Error loading alert state: {e}")
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.fired, f, separators=(",", ":"))
+            self._dirty = False
+        except Exception as e:
+            print(f"Error saving alert state: {e}")
+
+    def update(self, key: str, change_percent: float, threshold_percent: float, rearm_ratio: float = DEFAULT_REARM_RATIO) -> bool:
+        """
+        変動率を反映し、今回新たに発火した場合のみ True を返します。
+        発火中に逆方向へ閾値を超えた場合は再度発火します。
+        """
+        direction = 1 if change_percent > 0 else -1
+        state = self.fired.get(key)
+
+        if abs(change_percent) >= threshold_percent:
+            if state == direction:
+                return False
+            self.fired[key] = direction
+            self._dirty = True
+            return True
+
+        if state is not None and abs(change_percent) < threshold_percent * rearm_ratio:
+            del self.fired[key]
+            self._dirty = True
+        return False
+
+    def edge(self, key: str, active: bool) -> bool:
+        """
+        真偽値の状態について、False → True に変わった時のみ True を返します。
+        """
+        if active:
+            if key in self.fired:
+                return False
+            self.fired[key] = 1
+            self._dirty = True
+            return True
+
+        if key in self.fired:
+            del self.fired[key]
+            self._dirty = True
+        return False
+
+    def is_fired(self, key: str) -> bool:
+        return key in self.fired
+
+    def prune(self, keep: Callable[[str], bool]):
+        """
+        keep(key) が False のキー（削除された設定・ルールなど）を破棄します。
+        """
+        stale = [key for key in self.fired if not keep(key)]
+        for key in stale:
+            del self.fired[key]
+        if stale:
+            self._dirty = True
@@ -0,0 +1,100 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+@dataclass
+class CircuitBreaker:
+    """
+    失敗が続く取得先（シンボル・外部API）を一時的に呼び出し対象から外します。
+
+    - closed: 通常どおり呼び出す。連続 failure_threshold 回失敗すると open へ。
+    - open: 呼び出さない。retry_at を過ぎたら probe_due() が一度だけ True を返し half_open へ。
+    - half_open: 試し呼び出し中。成功で closed、失敗で待機時間を倍にして再び open へ。
+    """
+    name: str
+    failure_threshold: int = 3
+    base_backoff: float = 30.0
+    max_backoff: float = 900.0
+
+    state: str = STATE_CLOSED
+    failures: int = 0 # 連続失敗回数
+    backoff: float = 0.0
+    retry_at: float = 0.0 # 次に試し呼び出しできる時刻(monotonic)
+    opened_count: int = 0
+
+    def allow(self) -> bool:
+        return self.state == STATE_CLOSED
+
+    def probe_due(self, now: Optional[float] = None) -> bool:
+        """
+        open で待機時間を過ぎていれば half_open にして True を返します（試し呼び出しは同時に1つ）。
+        """
+        if self.state != STATE_OPEN:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if now < self.retry_at:
+            return False
+        self.state = STATE_HALF_OPEN
+        return True
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        if self.state == STATE_CLOSED:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self.retry_at - now)
+
+    def record_success(self):
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.backoff = 0.0
+
+    def record_failure(self, now: Optional[float] = None):
+        if now is None:
+            now = time.monotonic()
+        self.failures += 1
+        if self.state == STATE_CLOSED:
+            if self.failures < self.failure_threshold:
+                return
+            self.backoff = self.base_backoff
+        else:
+            # 試し呼び出しも失敗したら指数バックオフ
+            self.backoff = min(self.max_backoff, max(self.base_backoff, self.backoff * 2))
+        self.state = STATE_OPEN
+        self.retry_at = now + self.backoff
+        self.opened_count += 1
+
+class BreakerRegistry:
+    """
+    名前（例: "price:114514USDT", "quickchart", "fx"）ごとのサーキットブレーカーを保持します。
+    """
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name=name, **self.defaults)
+            self.breakers[name] = breaker
+        return breaker
+
+    def prune(self, keep: Callable[[str], bool]):
+        for name in [n for n in self.breakers if not keep(n)]:
+            del self.breakers[name]
+
+    def tripped(self) -> List[CircuitBreaker]:
+        return sorted((b for b in self.breakers.values() if b.state != STATE_CLOSED), key=lambda b: b.name)
+
+    def stats(self) -> Dict[str, int]:
+        counts = {STATE_CLOSED: 0, STATE_OPEN: 0, STATE_HALF_OPEN: 0}
+        for breaker in self.breakers.values():
+            counts[breaker.state] += 1
+        return counts
+
+breakers = BreakerRegistry()
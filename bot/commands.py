@@ -1,11 +1,42 @@
 import discord
 import io
+import os
+import time
+from datetime import datetime, timezone
 from discord import app_commands
 from bot.config_store import config_store
 from bot.monitor import monitor
 from bot.mexc_api import mexc_api
 from bot.exchange_rate import exchange_rate_api
 from bot.dex_api import dex_api
+from bot.rules import rule_engine, parse_conditions, MODE_ALL, MODE_ANY
+from bot.alert_state import DEFAULT_REARM_RATIO
+from bot.outbound import outbound_queue
+from bot.symbol_catalog import symbol_catalog
+from bot.price_provider import price_provider
+from bot.circuit_breaker import breakers
+from bot.portfolio import portfolio_book, MAX_PORTFOLIO_SYMBOLS
+from bot.exchange_rate import currency_symbol
+from bot.volatility import ALERT_MODE_PERCENT, ALERT_MODE_SIGMA
+from bot.export import export_history, FORMAT_CSV, FORMAT_NDJSON_GZ
+from bot.liquidity import liquidity_monitor, classify_risk, risk_band, pair_metrics, MAX_WATCHES_PER_TARGET
+
+ALERT_MODE_CHOICES = [
+    app_commands.Choice(name="閾値 (%)", value=ALERT_MODE_PERCENT),
+    app_commands.Choice(name="平常時の変動の k σ", value=ALERT_MODE_SIGMA),
+]
+
+# DMなどギルド外でのファイル添付の上限（バイト）
+EXPORT_DEFAULT_FILESIZE_LIMIT = 10 * 1024 * 1024
+
+def describe_alert_mode(config) -> str:
+    if config.alert_mode == ALERT_MODE_SIGMA:
+        return f"±{config.sigma_k}σ（{config.window_minutes}分変動率の直近60分の分布）"
+    return f"±{config.threshold_percent}%"
+
+async def symbol_autocomplete(interaction: discord.Interaction, current: str):
+    # カタログのメモリ内索引のみで候補を返す（HTTPなし）
+    return [app_commands.Choice(name=s, value=s) for s in symbol_catalog.search(current)]
 
 def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
     
@@ -19,13 +50,21 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         window_minutes="変動率判定の時間窓（分）",
         threshold_percent="通知する変動率の閾値（%）",
         symbol="監視するシンボル（例: 114514USDT）",
-        rename="チャンネル名に価格を表示するか(True/False)"
+        rename="チャンネル名に価格を表示するか(True/False)",
+        rearm_ratio="変動率が閾値のこの割合まで戻ったら再通知可能にする（0〜1、既定0.5）",
+        alert_mode="通知の判定方式（閾値% / 平常時の変動のkσ）",
+        sigma_k="σモードで通知する倍率 k（既定3）"
     )
+    @app_commands.choices(alert_mode=ALERT_MODE_CHOICES)
+    @app_commands.autocomplete(symbol=symbol_autocomplete)
     async def config_set(interaction: discord.Interaction, 
                          window_minutes: int = None, 
                          threshold_percent: float = None, 
                          symbol: str = None,
-                         rename: bool = None):
+                         rename: bool = None,
+                         rearm_ratio: app_commands.Range[float, 0.0, 1.0] = None,
+                         alert_mode: app_commands.Choice[str] = None,
+                         sigma_k: app_commands.Range[float, 0.5, 10.0] = None):
         
         channel_id = interaction.channel_id
         if not channel_id:
@@ -52,7 +91,8 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
             msg_parts.append(f"閾値: {threshold_percent}%")
             
         if symbol is not None:
-            exists = await mexc_api.check_symbol_exists(symbol)
+            symbol = symbol.upper()
+            exists = await symbol_catalog.exists(symbol)
             if not exists:
                 await interaction.response.send_message(f"シンボル `{symbol}` はMEXCに見つかりませんでした。", ephemeral=True)
                 return
@@ -64,6 +104,18 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
             status = "有効" if rename else "無効"
             msg_parts.append(f"チャンネル名自動更新: {status}")
 
+        if rearm_ratio is not None:
+            updates["rearm_ratio"] = rearm_ratio
+            msg_parts.append(f"再通知: 閾値の{rearm_ratio:.0%}未満に戻った後")
+
+        if alert_mode is not None:
+            updates["alert_mode"] = alert_mode.value
+            msg_parts.append(f"判定方式: {alert_mode.name}")
+
+        if sigma_k is not None:
+            updates["sigma_k"] = sigma_k
+            msg_parts.append(f"σ倍率: {sigma_k}")
+
         if not updates:
             await interaction.response.send_message("変更する項目を指定してください。", ephemeral=True)
             return
@@ -91,8 +143,9 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         embed.add_field(name="状態", value=status_emoji, inline=False)
         embed.add_field(name="監視シンボル", value=config.symbol, inline=True)
         embed.add_field(name="時間窓", value=f"{config.window_minutes}分", inline=True)
-        embed.add_field(name="閾値", value=f"±{config.threshold_percent}%", inline=True)
+        embed.add_field(name="閾値", value=describe_alert_mode(config), inline=True)
         embed.add_field(name="チャンネル名更新", value=rename_emoji, inline=True)
+        embed.add_field(name="再通知", value=f"閾値の{config.rearm_ratio:.0%}未満に戻った後", inline=True)
         
         await interaction.response.send_message(embed=embed)
 
@@ -108,13 +161,23 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         window_minutes="変動率判定の時間窓（分）",
         threshold_percent="通知する変動率の閾値（%）",
         symbol="監視するシンボル（例: 114514USDT）",
-        holdings="保有しているコインの枚数（通知時の資産計算用）"
+        holdings="保有しているコインの枚数（通知時の資産計算用）",
+        rearm_ratio="変動率が閾値のこの割合まで戻ったら再通知可能にする（0〜1、既定0.5）",
+        currency="通知・資産計算の表示通貨（例: JPY, USD, EUR）",
+        alert_mode="通知の判定方式（閾値% / 平常時の変動のkσ）",
+        sigma_k="σモードで通知する倍率 k（既定3）"
     )
+    @app_commands.choices(alert_mode=ALERT_MODE_CHOICES)
+    @app_commands.autocomplete(symbol=symbol_autocomplete)
     async def dm_config(interaction: discord.Interaction, 
                         window_minutes: int = None, 
                         threshold_percent: float = None, 
                         symbol: str = None,
-                        holdings: float = None):
+                        holdings: float = None,
+                        rearm_ratio: app_commands.Range[float, 0.0, 1.0] = None,
+                        currency: str = None,
+                        alert_mode: app_commands.Choice[str] = None,
+                        sigma_k: app_commands.Range[float, 0.5, 10.0] = None):
         
         user_id = interaction.user.id
         updates = {}
@@ -129,7 +192,8 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
             msg_parts.append(f"閾値: {threshold_percent}%")
             
         if symbol is not None:
-            exists = await mexc_api.check_symbol_exists(symbol)
+            symbol = symbol.upper()
+            exists = await symbol_catalog.exists(symbol)
             if not exists:
                 await interaction.response.send_message(f"シンボル `{symbol}` はMEXCに見つかりませんでした。", ephemeral=True)
                 return
@@ -140,6 +204,28 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
             updates["holdings"] = holdings
             msg_parts.append(f"保有枚数: {holdings:,.4f}")
 
+        if rearm_ratio is not None:
+            updates["rearm_ratio"] = rearm_ratio
+            msg_parts.append(f"再通知: 閾値の{rearm_ratio:.0%}未満に戻った後")
+
+        if currency is not None:
+            currency = currency.strip().upper()
+            # 1回の取得で全通貨のレートがキャッシュされるので、追加のリクエストは発生しない
+            await exchange_rate_api.get_rate(currency)
+            if not exchange_rate_api.supports(currency):
+                await interaction.response.send_message(f"通貨 `{currency}` には対応していません。", ephemeral=True)
+                return
+            updates["currency"] = currency
+            msg_parts.append(f"表示通貨: {currency}")
+
+        if alert_mode is not None:
+            updates["alert_mode"] = alert_mode.value
+            msg_parts.append(f"判定方式: {alert_mode.name}")
+
+        if sigma_k is not None:
+            updates["sigma_k"] = sigma_k
+            msg_parts.append(f"σ倍率: {sigma_k}")
+
         if not updates and not config_store.get_user_config(user_id):
             await interaction.response.send_message("変更する項目を指定してください。", ephemeral=True)
             return
@@ -149,7 +235,7 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         # 現在設定を表示して完了
         config = config_store.get_user_config(user_id)
         msg_parts.insert(0, "✅ **個人設定を更新しました**")
-        msg_parts.append(f"現在の設定: {config.symbol} | {config.window_minutes}分 | ±{config.threshold_percent}% | 保有: {config.holdings:,.4f}")
+        msg_parts.append(f"現在の設定: {config.symbol} | {config.window_minutes}分 | {describe_alert_mode(config)} | 保有: {config.holdings:,.4f}")
         
         await interaction.response.send_message("\n".join(msg_parts), ephemeral=True)
 
@@ -176,7 +262,9 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         embed.add_field(name="状態", value=status, inline=False)
         embed.add_field(name="監視シンボル", value=config.symbol, inline=True)
         embed.add_field(name="時間窓", value=f"{config.window_minutes}分", inline=True)
-        embed.add_field(name="閾値", value=f"±{config.threshold_percent}%", inline=True)
+        embed.add_field(name="閾値", value=describe_alert_mode(config), inline=True)
+        embed.add_field(name="再通知", value=f"閾値の{config.rearm_ratio:.0%}未満に戻った後", inline=True)
+        embed.add_field(name="表示通貨", value=config.currency, inline=True)
         
         if config.holdings > 0:
             embed.add_field(name="保有枚数", value=f"{config.holdings:,.4f}", inline=True)
@@ -185,6 +273,267 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
 
     tree.add_command(dm_group)
 
+    # ----------------------------------------------------
+    # /portfolio (複数銘柄の保有資産)
+    # ----------------------------------------------------
+    portfolio_group = app_commands.Group(name="portfolio", description="複数銘柄の保有資産（ポートフォリオ）")
+
+    @portfolio_group.command(name="show", description="ポートフォリオの評価額を表示します")
+    async def portfolio_show(interaction: discord.Interaction):
+        # 監視ループが更新した評価額と手元の為替レートだけで返す（HTTPなし）
+        config = config_store.user_configs.get(interaction.user.id)
+        valuation = portfolio_book.valuation(interaction.user.id)
+        if config is None or valuation is None:
+            await interaction.response.send_message("ポートフォリオが登録されていません。`/portfolio set` で銘柄を追加してください。", ephemeral=True)
+            return
+
+        currency = config.currency
+        fx_rate = exchange_rate_api.peek_rate(currency)
+        if fx_rate is None:
+            currency, fx_rate = "USD", 1.0
+        fiat = currency_symbol(currency)
+
+        embed = discord.Embed(title="💼 ポートフォリオ", color=0x9b59b6)
+        for position in valuation.positions[:20]:
+            if position.price is None:
+                value = f"{position.amount:,.4f}枚\n価格取得待ち"
+            else:
+                share = position.value / valuation.total * 100 if valuation.total > 0 else 0
+                value = (f"{position.amount:,.4f}枚 × ${position.price:.6f}\n"
+                         f"{fiat}{position.value * fx_rate:,.0f} ({share:.1f}%)")
+            embed.add_field(name=position.symbol, value=value, inline=True)
+
+        embed.add_field(name="合計", value=f"**{fiat}{valuation.total * fx_rate:,.0f}** (${valuation.total:,.2f})", inline=False)
+        if config.portfolio_threshold_percent > 0:
+            embed.add_field(name="変動通知", value=f"{config.portfolio_window_minutes}分で±{config.portfolio_threshold_percent}%", inline=False)
+        if valuation.updated_at:
+            embed.set_footer(text="最終更新")
+            embed.timestamp = datetime.fromtimestamp(valuation.updated_at, tz=timezone.utc)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @portfolio_group.command(name="set", description="ポートフォリオの銘柄の保有枚数を設定します（0で削除）")
+    @app_commands.describe(symbol="銘柄（例: 114514USDT）", amount="保有枚数（0で削除）")
+    @app_commands.autocomplete(symbol=symbol_autocomplete)
+    async def portfolio_set(interaction: discord.Interaction, symbol: str, amount: app_commands.Range[float, 0.0, None]):
+        user_id = interaction.user.id
+        symbol = symbol.upper()
+        config = config_store.get_user_config(user_id)
+        # 初回は /dm config の保有枚数を引き継ぐ
+        portfolio = config.positions()
+
+        if amount == 0:
+            if symbol not in portfolio:
+                await interaction.response.send_message(f"`{symbol}` はポートフォリオにありません。", ephemeral=True)
+                return
+            del portfolio[symbol]
+        else:
+            if symbol not in portfolio and len(portfolio) >= MAX_PORTFOLIO_SYMBOLS:
+                await interaction.response.send_message(f"登録できる銘柄は{MAX_PORTFOLIO_SYMBOLS}件までです。", ephemeral=True)
+                return
+            if not await symbol_catalog.exists(symbol):
+                await interaction.response.send_message(f"シンボル `{symbol}` はMEXCに見つかりませんでした。", ephemeral=True)
+                return
+            portfolio[symbol] = amount
+
+        config_store.update_user_config(user_id, portfolio=portfolio)
+        if amount == 0:
+            message = f"`{symbol}` をポートフォリオから削除しました。"
+        else:
+            message = f"`{symbol}` の保有枚数を {amount:,.4f} に設定しました。"
+        await interaction.response.send_message(f"{message}（{len(portfolio)}銘柄。評価額は次回の価格取得から反映されます）", ephemeral=True)
+
+    @portfolio_group.command(name="alert", description="ポートフォリオ評価額の変動通知（DM）を設定します")
+    @app_commands.describe(
+        threshold_percent="通知する評価額の変動率（%）。0で無効",
+        window_minutes="変動率判定の時間窓（分）"
+    )
+    async def portfolio_alert(interaction: discord.Interaction,
+                              threshold_percent: app_commands.Range[float, 0.0, None],
+                              window_minutes: app_commands.Range[int, 1, 60] = None):
+        updates = {"portfolio_threshold_percent": threshold_percent}
+        if window_minutes is not None:
+            updates["portfolio_window_minutes"] = window_minutes
+        config = config_store.update_user_config(interaction.user.id, **updates)
+
+        if threshold_percent == 0:
+            await interaction.response.send_message("ポートフォリオの変動通知を無効にしました。", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f"ポートフォリオの評価額が{config.portfolio_window_minutes}分で±{threshold_percent}%変動したらDMで通知します。",
+            ephemeral=True
+        )
+
+    tree.add_command(portfolio_group)
+
+    # ----------------------------------------------------
+    # /rule (アラートルール)
+    # ----------------------------------------------------
+    rule_group = app_commands.Group(name="rule", description="価格水準・複数条件のアラートルール管理")
+
+    async def resolve_rule_target(interaction: discord.Interaction, dm: bool):
+        """
+        ルールの通知先 (target_id, is_user) を決定します。権限不足時は None。
+        """
+        if dm or interaction.guild is None:
+            return interaction.user.id, True
+        if not interaction.user.guild_permissions.manage_channels:
+            await interaction.response.send_message("チャンネル向けルールの操作には権限(チャンネル管理)が必要です。`dm:True` で個人ルールを操作できます。", ephemeral=True)
+            return None
+        return interaction.channel_id, False
+
+    @rule_group.command(name="add", description="アラートルールを追加します")
+    @app_commands.describe(
+        symbol="対象シンボル（例: 114514USDT）",
+        conditions="条件（空白区切り）例: above:0.0002 change:5:2 drawdown:30:5 breakout:60",
+        mode="複数条件の組み合わせ方",
+        dm="DMで通知を受け取る個人ルールにするか",
+        rearm_ratio="変動率条件が閾値のこの割合まで戻ったら再通知可能にする（0〜1、既定0.5）"
+    )
+    @app_commands.choices(mode=[
+        app_commands.Choice(name="いずれか (OR)", value=MODE_ANY),
+        app_commands.Choice(name="すべて (AND)", value=MODE_ALL),
+    ])
+    @app_commands.autocomplete(symbol=symbol_autocomplete)
+    async def rule_add(interaction: discord.Interaction,
+                       symbol: str,
+                       conditions: str,
+                       mode: app_commands.Choice[str] = None,
+                       dm: bool = False,
+                       rearm_ratio: app_commands.Range[float, 0.0, 1.0] = DEFAULT_REARM_RATIO):
+        target = await resolve_rule_target(interaction, dm)
+        if target is None:
+            return
+        target_id, is_user = target
+
+        try:
+            parsed = parse_conditions(conditions)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+
+        symbol = symbol.upper()
+        exists = await symbol_catalog.exists(symbol)
+        if not exists:
+            await interaction.response.send_message(f"シンボル `{symbol}` はMEXCに見つかりませんでした。", ephemeral=True)
+            return
+
+        try:
+            rule = rule_engine.add_rule(target_id, is_user, symbol, parsed, mode.value if mode else MODE_ANY, rearm_ratio)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+
+        where = "DM" if is_user else "このチャンネル"
+        await interaction.response.send_message(f"ルール#{rule.rule_id} を追加しました（通知先: {where}）\n{rule.symbol}: {rule.describe()}", ephemeral=is_user)
+
+    @rule_group.command(name="list", description="登録済みのアラートルールを表示します")
+    @app_commands.describe(dm="個人ルールを表示するか")
+    async def rule_list(interaction: discord.Interaction, dm: bool = False):
+        target = await resolve_rule_target(interaction, dm)
+        if target is None:
+            return
+        target_id, is_user = target
+
+        rules = rule_engine.get_rules(target_id, is_user)
+        if not rules:
+            await interaction.response.send_message("登録されているルールはありません。", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="🔔 アラートルール" + (" (DM)" if is_user else ""), color=0xf39c12)
+        for rule in rules[:25]:
+            embed.add_field(name=f"#{rule.rule_id} {rule.symbol}", value=rule.describe(), inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=is_user)
+
+    @rule_group.command(name="remove", description="アラートルールを削除します")
+    @app_commands.describe(rule_id="削除するルールの番号", dm="個人ルールを削除するか")
+    async def rule_remove(interaction: discord.Interaction, rule_id: int, dm: bool = False):
+        target = await resolve_rule_target(interaction, dm)
+        if target is None:
+            return
+        target_id, is_user = target
+
+        if rule_engine.remove_rule(rule_id, target_id, is_user):
+            await interaction.response.send_message(f"ルール#{rule_id} を削除しました。", ephemeral=is_user)
+        else:
+            await interaction.response.send_message(f"ルール#{rule_id} は見つかりませんでした。", ephemeral=True)
+
+    tree.add_command(rule_group)
+
+    # ----------------------------------------------------
+    # /liquidity (流動性ウォッチ)
+    # ----------------------------------------------------
+    liquidity_group = app_commands.Group(name="liquidity", description="DEXトークンの流動性リスク（MCap/Liq比率）のウォッチ")
+
+    @liquidity_group.command(name="watch", description="トークンの流動性リスク帯が変わったら通知します")
+    @app_commands.describe(token="シンボルまたはトークンアドレス（例: 114514）", dm="DMで通知を受け取るか")
+    async def liquidity_watch(interaction: discord.Interaction, token: str, dm: bool = False):
+        target = await resolve_rule_target(interaction, dm)
+        if target is None:
+            return
+        target_id, is_user = target
+
+        await interaction.response.defer(ephemeral=is_user)
+        query = token.strip()
+        if not query.startswith("0x"):
+            query = query.upper().replace("USDT", "")
+        stats = await dex_api.get_token_stats(query)
+        if not stats:
+            await interaction.followup.send(f"トークン `{query}` の情報がDexScreenerで見つかりませんでした。")
+            return
+
+        try:
+            watch = liquidity_monitor.add_watch(target_id, is_user, stats)
+        except ValueError as e:
+            await interaction.followup.send(str(e))
+            return
+
+        _, liquidity, market_cap = pair_metrics(stats)
+        _, band = classify_risk(market_cap, liquidity)
+        where = "DM" if is_user else "このチャンネル"
+        await interaction.followup.send(
+            f"{watch.symbol} ({watch.chain_id}) の流動性ウォッチを開始しました（通知先: {where}）\n"
+            f"現在: {band.label} / 比率 {watch.last_ratio:.1f}倍"
+        )
+
+    @liquidity_group.command(name="list", description="流動性ウォッチ中のトークンを表示します")
+    @app_commands.describe(dm="個人のウォッチを表示するか")
+    async def liquidity_list(interaction: discord.Interaction, dm: bool = False):
+        target = await resolve_rule_target(interaction, dm)
+        if target is None:
+            return
+        target_id, is_user = target
+
+        watches = liquidity_monitor.get_watches(target_id, is_user)
+        if not watches:
+            await interaction.response.send_message("流動性ウォッチ中のトークンはありません。", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="🛡️ 流動性ウォッチ" + (" (DM)" if is_user else ""), color=0x3498db)
+        for watch in watches[:MAX_WATCHES_PER_TARGET]:
+            if watch.last_level is None:
+                status = "未取得"
+            else:
+                status = f"{risk_band(watch.last_ratio, watch.last_level).label} / 比率 {watch.last_ratio:.1f}倍"
+            embed.add_field(name=f"{watch.symbol} ({watch.chain_id})", value=f"{status}\n`{watch.token_address}`", inline=False)
+        embed.set_footer(text=f"{liquidity_monitor.interval:.0f}秒ごとに更新 / Data provided by DexScreener")
+        await interaction.response.send_message(embed=embed, ephemeral=is_user)
+
+    @liquidity_group.command(name="unwatch", description="流動性ウォッチを解除します")
+    @app_commands.describe(token="シンボルまたはトークンアドレス", dm="個人のウォッチを解除するか")
+    async def liquidity_unwatch(interaction: discord.Interaction, token: str, dm: bool = False):
+        target = await resolve_rule_target(interaction, dm)
+        if target is None:
+            return
+        target_id, is_user = target
+
+        watch = liquidity_monitor.remove_watch(target_id, is_user, token)
+        if watch:
+            await interaction.response.send_message(f"{watch.symbol} の流動性ウォッチを解除しました。", ephemeral=is_user)
+        else:
+            await interaction.response.send_message(f"`{token}` はウォッチされていません。", ephemeral=True)
+
+    tree.add_command(liquidity_group)
+
     # ----------------------------------------------------
     # /monitor (チャンネル監視制御 - 既存)
     # ----------------------------------------------------
@@ -202,8 +551,7 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
              await interaction.response.send_message("このコマンドを実行するには権限(チャンネル管理)が必要です。", ephemeral=True)
              return
 
-        config = config_store.get_config(channel_id)
-        config_store.update_config(channel_id, monitoring_enabled=True)
+        config = config_store.update_config(channel_id, monitoring_enabled=True)
         await interaction.response.send_message(f"監視を開始しました。{config.symbol}の変動をこのチャンネルに通知します。")
 
     @monitor_group.command(name="stop", description="このチャンネルでの監視を停止します")
@@ -231,6 +579,7 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         symbol = "114514USDT"
         window_minutes = 5
         threshold = 2.0
+        threshold_text = None
         
         # チャンネル設定があればそれを使用、なければ個人設定、なければデフォルト
         if interaction.channel_id:
@@ -239,6 +588,7 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
                 symbol = c_config.symbol
                 window_minutes = c_config.window_minutes
                 threshold = c_config.threshold_percent
+                threshold_text = describe_alert_mode(c_config)
         
         # 明示的に個人設定が優先されるべきかは議論があるが、
         # /status は「今のコンテキスト」で見たいことが多いのでチャンネル優先、
@@ -248,6 +598,7 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
             symbol = u_config.symbol
             window_minutes = u_config.window_minutes
             threshold = u_config.threshold_percent
+            threshold_text = describe_alert_mode(u_config)
 
         price = await mexc_api.get_price(symbol)
         if price is None:
@@ -268,57 +619,33 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
             embed.add_field(name="変動率", value=f"{emoji} {change_percent:+.3f}%", inline=True)
         else:
             embed.add_field(name=f"{window_minutes}分前", value="データ収集中...", inline=True)
+
+        # 監視ループが逐次更新している集計値を読むだけ（追加の計算・取得なし）
+        extremes = monitor.extremes.get(symbol, window_minutes)
+        if extremes is not None and extremes.high is not None:
+            embed.add_field(
+                name=f"{window_minutes}分高値 / 安値",
+                value=f"${extremes.high:.6f} / ${extremes.low:.6f}\n(高値から -{extremes.drawdown_percent(price):.2f}%)",
+                inline=False
+            )
+
+        stats = monitor.volatility.get(symbol, window_minutes)
+        if stats is not None and stats.std is not None:
+            value = f"σ {stats.std:.2f}% (平均 {stats.mean:+.2f}%, n={stats.n})"
+            if past_price:
+                zscore = stats.zscore(change_percent)
+                if zscore is not None:
+                    value += f"\n現在 {zscore:+.1f}σ"
+            embed.add_field(name=f"{window_minutes}分変動率のボラティリティ（直近60分）", value=value, inline=False)
             
-        embed.set_footer(text=f"閾値: ±{threshold}%")
+        embed.set_footer(text=f"閾値: {threshold_text or f'±{threshold}%'}")
         
-        # チャート画像の生成
+        # チャート画像の生成（通知と同じ描画処理。QuickChartが落ちている間は画像なし）
         file = None
-        history = monitor.get_recent_history(symbol)
-        if len(history) > 2:
-            try:
-                # データを間引いてURL長を抑える（最大50点くらいに）
-                step = max(1, len(history) // 50)
-                chart_data = history[::step]
-                
-                prices = [h[1] for h in chart_data]
-                labels = ["" for _ in chart_data] # ラベルは省略
-                
-                # QuickChart API URL生成
-                # 背景透過、線グラフ、点なし
-                qc_config = {
-                    "type": "line",
-                    "data": {
-                        "labels": labels,
-                        "datasets": [{
-                            "label": symbol,
-                            "data": prices,
-                            "borderColor": "rgb(75, 192, 192)",
-                            "borderWidth": 2,
-                            "pointRadius": 0,
-                            "fill": False
-                        }]
-                    },
-                    "options": {
-                        "legend": {"display": False},
-                        "scales": {
-                            "xAxes": [{"display": False}], # X軸非表示
-                            "yAxes": [{"display": True}]
-                        }
-                    }
-                }
-                
-                # URL生成ではなくPOSTで画像を取得する (URL長制限回避)
-                session = await mexc_api.get_session()
-                async with session.post("https://quickchart.io/chart", json={"chart": qc_config, "width": 500, "height": 300, "backgroundColor": "white"}) as resp:
-                    if resp.status == 200:
-                        image_data = await resp.read()
-                        file = discord.File(io.BytesIO(image_data), filename="chart.png")
-                        embed.set_image(url="attachment://chart.png")
-                    else:
-                         print(f"QuickChart error: {resp.status}")
-
-            except Exception as e:
-                print(f"Chart generation error: {e}")
+        image_data = await monitor._render_chart(symbol)
+        if image_data:
+            file = discord.File(io.BytesIO(image_data), filename="chart.png")
+            embed.set_image(url="attachment://chart.png")
 
         if file:
             await interaction.followup.send(embed=embed, file=file)
@@ -332,30 +659,33 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         await interaction.response.defer()
         
         symbol = "114514USDT"
+        currency = "JPY"
         
-        # コンテキストに合わせてシンボルを決定
+        # コンテキストに合わせてシンボル（DMでは表示通貨も）を決定
         if interaction.guild_id:
              if interaction.channel_id in config_store.configs:
                  symbol = config_store.configs[interaction.channel_id].symbol
         else:
              if interaction.user.id in config_store.user_configs:
                  symbol = config_store.user_configs[interaction.user.id].symbol
+                 currency = config_store.user_configs[interaction.user.id].currency
 
         price = await mexc_api.get_price(symbol)
         if price is None:
             await interaction.followup.send(f"{symbol} の価格取得に失敗しました。")
             return
 
-        usd_jpy = await exchange_rate_api.get_usd_jpy_rate()
-        price_jpy = price * usd_jpy
+        currency, fx_rate = await exchange_rate_api.get_display_rate(currency)
+        unit = "円" if currency == "JPY" else currency
+        price_fiat = price * fx_rate
         
-        total_jpy = amount * price_jpy
+        total_fiat = amount * price_fiat
         total_usd = amount * price
 
         embed = discord.Embed(title="💰 資産計算", color=0xf1c40f)
         embed.add_field(name="保有枚数", value=f"{amount:,.0f} {symbol.replace('USDT', '')}", inline=False)
-        embed.add_field(name="現在レート", value=f"1枚 = {price_jpy:.4f}円", inline=False)
-        embed.add_field(name="評価額", value=f"**{total_jpy:,.0f} 円**\n(${total_usd:,.2f})", inline=False)
+        embed.add_field(name="現在レート", value=f"1枚 = {price_fiat:.4f}{unit}", inline=False)
+        embed.add_field(name="評価額", value=f"**{total_fiat:,.0f} {unit}**\n(${total_usd:,.2f})", inline=False)
         
         await interaction.followup.send(embed=embed)
 
@@ -393,11 +723,7 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         base_token = stats.get("baseToken", {})
         token_name = base_token.get("name", "Unknown")
         token_symbol = base_token.get("symbol", search_query)
-        price_usd = float(stats.get("priceUsd", 0) or 0)
-        
-        liquidity = float(stats.get("liquidity", {}).get("usd", 0) or 0)
-        # marketCapがあれば使う、なければfdvを使う
-        market_cap = float(stats.get("marketCap", 0) or stats.get("fdv", 0) or 0)
+        price_usd, liquidity, market_cap = pair_metrics(stats)
         
         url = stats.get("url", "https://dexscreener.com/")
         
@@ -405,31 +731,11 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
              await interaction.followup.send(f"トークン `{token_symbol}` の流動性情報が取得できませんでした（Liquidity: $0）。")
              return
 
-        # 比率計算 (Market Cap / Liquidity)
-        ratio = market_cap / liquidity if liquidity > 0 else 0
-        
-        # 評価ロジック
-        risk_level = "不明"
-        risk_color = 0x95a5a6 # Gray
-        comment = ""
-        
-        # 判定基準
-        if ratio > 50:
-            risk_level = "🔥 非常に危険 (Very High Risk)"
-            risk_color = 0xff0000 # Red
-            comment = f"時価総額が流動性の**{ratio:.0f}倍**もあります。非常に流動性が薄く、売り圧で暴落しやすい状態です。"
-        elif ratio > 20:
-            risk_level = "⚠️ 危険 (High Risk)"
-            risk_color = 0xe67e22 # Orange
-            comment = f"時価総額が流動性の{ratio:.0f}倍です。ボラティリティが高くなる傾向があります。"
-        elif ratio > 5:
-            risk_level = "🤔 普通 (Medium)"
-            risk_color = 0xf1c40f # Yellow
-            comment = "ミームコインとしては一般的な水準です。"
-        else:
-            risk_level = "✅ 健全 (Good)"
-            risk_color = 0x2ecc71 # Green
-            comment = "時価総額に対して十分な流動性があります。"
+        # 比率計算 (Market Cap / Liquidity) と判定（流動性ウォッチと共通）
+        ratio, band = classify_risk(market_cap, liquidity)
+        risk_level = band.label
+        risk_color = band.color
+        comment = band.comment
 
         ratio_str = f"{ratio:.1f}倍"
 
@@ -446,3 +752,115 @@ def setup_commands(tree: app_commands.CommandTree, bot: discord.Client):
         embed.set_footer(text="Data provided by DexScreener")
         
         await interaction.followup.send(embed=embed)
+
+    # /export コマンド
+    @tree.command(name="export", description="価格履歴をファイル（CSV / gzip NDJSON）で書き出します")
+    @app_commands.describe(
+        symbol="対象シンボル（例: 114514USDT）",
+        format="出力形式",
+        minutes="直近何分間を書き出すか（省略時は記録されている全期間）"
+    )
+    @app_commands.choices(format=[
+        app_commands.Choice(name="CSV", value=FORMAT_CSV),
+        app_commands.Choice(name="NDJSON (gzip圧縮)", value=FORMAT_NDJSON_GZ),
+    ])
+    @app_commands.autocomplete(symbol=symbol_autocomplete)
+    async def export(interaction: discord.Interaction,
+                     symbol: str,
+                     format: app_commands.Choice[str] = None,
+                     minutes: app_commands.Range[int, 1, 525600] = None):
+        await interaction.response.defer(ephemeral=True)
+
+        symbol = symbol.upper()
+        fmt = format.value if format else FORMAT_CSV
+        since = time.time() - minutes * 60 if minutes else None
+
+        try:
+            result = await export_history(symbol, fmt, since=since)
+        except Exception as e:
+            print(f"Error exporting history for {symbol}: {e}")
+            await interaction.followup.send("履歴の書き出しに失敗しました。", ephemeral=True)
+            return
+
+        try:
+            if result.rows == 0:
+                await interaction.followup.send(f"`{symbol}` の記録された価格はありません。", ephemeral=True)
+                return
+
+            limit = interaction.guild.filesize_limit if interaction.guild else EXPORT_DEFAULT_FILESIZE_LIMIT
+            if result.size > limit:
+                hint = "`minutes` で期間を絞るか、gzip圧縮NDJSON形式を指定してください。" if fmt == FORMAT_CSV else "`minutes` で期間を絞ってください。"
+                await interaction.followup.send(
+                    f"ファイルが大きすぎます（{result.size / 1024 / 1024:.1f}MB / 上限 {limit / 1024 / 1024:.0f}MB）。{hint}",
+                    ephemeral=True
+                )
+                return
+
+            # ファイルはディスクから読みながら送信される（全体をメモリに載せない）
+            await interaction.followup.send(
+                f"{symbol}: {result.rows:,}件 ({result.size / 1024:,.1f}KB)",
+                file=discord.File(result.path, filename=result.filename),
+                ephemeral=True
+            )
+        finally:
+            os.remove(result.path)
+
+    # /health コマンド（管理者用）
+    @tree.command(name="health", description="Botの内部状態（送信キュー・取得元・ブレーカーなど）を表示します（管理者用）")
+    async def health(interaction: discord.Interaction):
+        if interaction.guild is None or not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("このコマンドはサーバー管理者のみ使用できます。", ephemeral=True)
+            return
+
+        stats = outbound_queue.stats()
+        embed = discord.Embed(title="🩺 Bot状態", color=0x7f8c8d)
+
+        depth = stats["depth"]
+        oldest = stats["oldest"]
+        queue_lines = [f"{name}: {count}件 (最古 {oldest.get(name, 0):.1f}秒)" for name, count in depth.items()]
+        embed.add_field(name="送信キュー", value="\n".join(queue_lines) or "空", inline=False)
+
+        wait_lines = [f"{name}: p50 {w['p50']:.2f}s / p95 {w['p95']:.2f}s / max {w['max']:.2f}s" for name, w in stats["wait"].items()]
+        embed.add_field(name="送信待ち時間", value="\n".join(wait_lines) or "データなし", inline=False)
+
+        embed.add_field(
+            name="送信結果",
+            value=(f"成功 {stats['sent']} / 失敗 {stats['failed']} / レート制限 {stats['rate_limited']}\n"
+                   f"期限切れ破棄 {stats['dropped_stale']} / 置換 {stats['superseded']} / 制限中ルート {stats['blocked_routes']}"),
+            inline=False
+        )
+
+        pipeline = monitor.pipeline_stats()
+        stage_lines = [f"取得: 前回 {pipeline['fetch_duration']:.2f}秒 / 間隔 {pipeline['interval']}秒"]
+        for label, name in (("判定待ち", "evaluate"), ("送信待ち", "deliver")):
+            stage = pipeline[name]
+            stage_lines.append(
+                f"{label}: {stage['depth']}/{stage['maxsize']}件 (最古 {stage['oldest']:.1f}秒, 待ち p95 {stage['wait_p95']:.2f}秒) "
+                f"/ 処理 {stage['last_duration']:.2f}秒 / 破棄 {stage['dropped']}"
+            )
+        embed.add_field(name="監視ステージ", value="\n".join(stage_lines), inline=False)
+
+        prices = price_provider.stats()
+        source_lines = []
+        for name, source in prices["sources"].items():
+            p95 = f"{source['p95']:.2f}s" if source["p95"] is not None else "-"
+            source_lines.append(f"{name}: 成功 {source['ok']} / 失敗 {source['failed']} / p95 {p95}")
+        source_lines.append(f"ヘッジ {prices['hedged']} (セカンダリ勝ち {prices['hedge_won']}) / フェイルオーバー {prices['failover']}")
+        embed.add_field(name="価格取得元", value="\n".join(source_lines), inline=False)
+
+        counts = breakers.stats()
+        breaker_lines = [f"正常 {counts['closed']} / 停止中 {counts['open']} / 試行中 {counts['half_open']}"]
+        for breaker in breakers.tripped()[:15]:
+            breaker_lines.append(
+                f"{breaker.name}: {breaker.state} (連続失敗 {breaker.failures}, 再試行まで {breaker.retry_in():.0f}秒)"
+            )
+        embed.add_field(name="サーキットブレーカー", value="\n".join(breaker_lines), inline=False)
+
+        liquidity = liquidity_monitor.stats()
+        embed.add_field(
+            name="流動性ウォッチ",
+            value=f"ウォッチ {liquidity['watches']}件 / 前回 {liquidity['tokens']}トークンを {liquidity['requests']}リクエストで取得",
+            inline=False
+        )
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
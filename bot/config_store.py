@@ -1,12 +1,16 @@
 import json
 import os
-from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Mapping
+from dataclasses import dataclass, asdict, replace, field
+from bot.alert_state import DEFAULT_REARM_RATIO
+from bot.volatility import ALERT_MODE_PERCENT, DEFAULT_SIGMA_K
 
 CONFIG_FILE = "data/config.json"
 USER_CONFIG_FILE = "data/user_config.json"
 
-@dataclass
+# 設定はスナップショット間で共有されるため不変にする（変更は replace で新しいオブジェクトを作る）
+@dataclass(frozen=True)
 class ChannelConfig:
     channel_id: int
     guild_id: Optional[int] = None # 参考情報として保持
@@ -15,8 +19,11 @@ class ChannelConfig:
     monitoring_enabled: bool = False
     symbol: str = "114514USDT" # デフォルト
     rename_enabled: bool = False # チャンネル名の自動更新
+    rearm_ratio: float = DEFAULT_REARM_RATIO # 変動率が閾値のこの割合まで戻ったら再通知可能
+    alert_mode: str = ALERT_MODE_PERCENT # "percent": 閾値(%) / "sigma": 平常時の sigma_k σ
+    sigma_k: float = DEFAULT_SIGMA_K
 
-@dataclass
+@dataclass(frozen=True)
 class UserConfig:
     user_id: int
     window_minutes: int = 5
@@ -24,21 +31,77 @@ class UserConfig:
     monitoring_enabled: bool = False
     symbol: str = "114514USDT"
     holdings: float = 0.0 # 保有枚数
+    rearm_ratio: float = DEFAULT_REARM_RATIO
+    alert_mode: str = ALERT_MODE_PERCENT
+    sigma_k: float = DEFAULT_SIGMA_K
+    currency: str = "JPY" # 表示通貨
+    # 複数銘柄のポートフォリオ: symbol -> 保有枚数（空なら symbol/holdings を1銘柄として扱う）
+    portfolio: Dict[str, float] = field(default_factory=dict)
+    portfolio_threshold_percent: float = 0.0 # 評価額の変動通知の閾値（0で無効）
+    portfolio_window_minutes: int = 15
+
+    def positions(self) -> Dict[str, float]:
+        if self.portfolio:
+            return dict(self.portfolio)
+        return {self.symbol: self.holdings} if self.holdings > 0 else {}
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    ある時点の全設定。公開後は変更されないので、監視ループはロックなしで反復できます。
+    """
+    version: int
+    # channel_id -> ChannelConfig
+    configs: Mapping[int, ChannelConfig]
+    # user_id -> UserConfig
+    user_configs: Mapping[int, UserConfig]
 
 class ConfigStore:
+    """
+    設定の変更はコピーオンライト: 変更のたびに辞書を複製して新しいバージョンのスナップショットを公開します。
+    読み取り側は snapshot を一度取得すれば、その後コマンドで設定が変わっても影響を受けません。
+    """
     def __init__(self):
-        # channel_id -> ChannelConfig
-        self.configs: Dict[int, ChannelConfig] = {}
-        # user_id -> UserConfig
-        self.user_configs: Dict[int, UserConfig] = {}
+        self.snapshot = ConfigSnapshot(version=0, configs=MappingProxyType({}), user_configs=MappingProxyType({}))
         
         self.load()
         self.load_users()
 
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def configs(self) -> Mapping[int, ChannelConfig]:
+        return self.snapshot.configs
+
+    @property
+    def user_configs(self) -> Mapping[int, UserConfig]:
+        return self.snapshot.user_configs
+
+    def _publish(self, configs: Optional[Dict[int, ChannelConfig]] = None, user_configs: Optional[Dict[int, UserConfig]] = None):
+        current = self.snapshot
+        self.snapshot = ConfigSnapshot(
+            version=current.version + 1,
+            configs=MappingProxyType(configs) if configs is not None else current.configs,
+            user_configs=MappingProxyType(user_configs) if user_configs is not None else current.user_configs
+        )
+
+    def _set_config(self, config: ChannelConfig):
+        configs = dict(self.snapshot.configs)
+        configs[config.channel_id] = config
+        self._publish(configs=configs)
+
+    def _set_user_config(self, config: UserConfig):
+        user_configs = dict(self.snapshot.user_configs)
+        user_configs[config.user_id] = config
+        self._publish(user_configs=user_configs)
+
     def load(self):
         if not os.path.exists(CONFIG_FILE):
             return
 
+        configs: Dict[int, ChannelConfig] = {}
         try:
             with open(CONFIG_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
@@ -48,49 +111,65 @@ class ConfigStore:
                     
                     if channel_id:
                          cid = int(channel_id)
-                         self.configs[cid] = ChannelConfig(
+                         configs[cid] = ChannelConfig(
                              channel_id=cid,
                              guild_id=int(key_str) if key_str.isdigit() else None,
                              window_minutes=config_data.get("window_minutes", 5),
                              threshold_percent=config_data.get("threshold_percent", 2.0),
                              monitoring_enabled=config_data.get("monitoring_enabled", False),
                              symbol=config_data.get("symbol", "114514USDT"),
-                             rename_enabled=config_data.get("rename_enabled", False)
+                             rename_enabled=config_data.get("rename_enabled", False),
+                             rearm_ratio=config_data.get("rearm_ratio", DEFAULT_REARM_RATIO),
+                             alert_mode=config_data.get("alert_mode", ALERT_MODE_PERCENT),
+                             sigma_k=config_data.get("sigma_k", DEFAULT_SIGMA_K)
                          )
                     elif key_str.isdigit():
                         cid = int(key_str)
-                        self.configs[cid] = ChannelConfig(
+                        configs[cid] = ChannelConfig(
                              channel_id=cid,
                              guild_id=config_data.get("guild_id"),
                              window_minutes=config_data.get("window_minutes", 5),
                              threshold_percent=config_data.get("threshold_percent", 2.0),
                              monitoring_enabled=config_data.get("monitoring_enabled", False),
                              symbol=config_data.get("symbol", "114514USDT"),
-                             rename_enabled=config_data.get("rename_enabled", False)
+                             rename_enabled=config_data.get("rename_enabled", False),
+                             rearm_ratio=config_data.get("rearm_ratio", DEFAULT_REARM_RATIO),
+                             alert_mode=config_data.get("alert_mode", ALERT_MODE_PERCENT),
+                             sigma_k=config_data.get("sigma_k", DEFAULT_SIGMA_K)
                          )
 
         except Exception as e:
             print(f"Error loading config: {e}")
+        self._publish(configs=configs)
 
     def load_users(self):
         if not os.path.exists(USER_CONFIG_FILE):
             return
 
+        user_configs: Dict[int, UserConfig] = {}
         try:
             with open(USER_CONFIG_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 for uid_str, config_data in data.items():
                     uid = int(uid_str)
-                    self.user_configs[uid] = UserConfig(
+                    user_configs[uid] = UserConfig(
                         user_id=uid,
                         window_minutes=config_data.get("window_minutes", 5),
                         threshold_percent=config_data.get("threshold_percent", 2.0),
                         monitoring_enabled=config_data.get("monitoring_enabled", False),
                         symbol=config_data.get("symbol", "114514USDT"),
-                        holdings=config_data.get("holdings", 0.0)
+                        holdings=config_data.get("holdings", 0.0),
+                        rearm_ratio=config_data.get("rearm_ratio", DEFAULT_REARM_RATIO),
+                        alert_mode=config_data.get("alert_mode", ALERT_MODE_PERCENT),
+                        sigma_k=config_data.get("sigma_k", DEFAULT_SIGMA_K),
+                        currency=config_data.get("currency", "JPY"),
+                        portfolio={str(k): float(v) for k, v in config_data.get("portfolio", {}).items()},
+                        portfolio_threshold_percent=config_data.get("portfolio_threshold_percent", 0.0),
+                        portfolio_window_minutes=config_data.get("portfolio_window_minutes", 15)
                     )
         except Exception as e:
             print(f"Error loading user config: {e}")
+        self._publish(user_configs=user_configs)
 
     def save(self):
         data = {str(cid): asdict(cfg) for cid, cfg in self.configs.items()}
@@ -112,28 +191,32 @@ class ConfigStore:
 
     def get_config(self, channel_id: int) -> ChannelConfig:
         if channel_id not in self.configs:
-            self.configs[channel_id] = ChannelConfig(channel_id=channel_id)
+            self._set_config(ChannelConfig(channel_id=channel_id))
             self.save()
         return self.configs[channel_id]
     
     def get_user_config(self, user_id: int) -> UserConfig:
         if user_id not in self.user_configs:
-            self.user_configs[user_id] = UserConfig(user_id=user_id)
+            self._set_user_config(UserConfig(user_id=user_id))
             self.save_users()
         return self.user_configs[user_id]
 
-    def update_config(self, channel_id: int, **kwargs):
+    def update_config(self, channel_id: int, **kwargs) -> ChannelConfig:
         config = self.get_config(channel_id)
-        for key, value in kwargs.items():
-            if hasattr(config, key):
-                setattr(config, key, value)
+        changes = {key: value for key, value in kwargs.items() if hasattr(config, key)}
+        if changes:
+            config = replace(config, **changes)
+            self._set_config(config)
         self.save()
+        return config
 
-    def update_user_config(self, user_id: int, **kwargs):
+    def update_user_config(self, user_id: int, **kwargs) -> UserConfig:
         config = self.get_user_config(user_id)
-        for key, value in kwargs.items():
-            if hasattr(config, key):
-                setattr(config, key, value)
+        changes = {key: value for key, value in kwargs.items() if hasattr(config, key)}
+        if changes:
+            config = replace(config, **changes)
+            self._set_user_config(config)
         self.save_users()
+        return config
 
 config_store = ConfigStore()
@@ -2,9 +2,12 @@ import aiohttp
 from typing import Optional, Dict, List, Any
 
 BASE_URL = "https://api.dexscreener.com/latest/dex"
+# /tokens エンドポイントで一度に指定できるアドレス数
+MAX_TOKENS_PER_REQUEST = 30
 
 class DexApi:
-    def __init__(self):
+    def __init__(self, base_url: str = BASE_URL):
+        self.base_url = base_url
         self.session: Optional[aiohttp.ClientSession] = None
 
     async def get_session(self) -> aiohttp.ClientSession:
@@ -21,7 +24,7 @@ class DexApi:
         シンボルまたはアドレスでペアを検索します。
         """
         session = await self.get_session()
-        url = f"{BASE_URL}/search"
+        url = f"{self.base_url}/search"
         params = {"q": query}
         
         try:
@@ -54,4 +57,46 @@ class DexApi:
         
         return sorted_pairs[0]
 
+    async def get_pair(self, chain_id: str, pair_address: str) -> Optional[Dict[str, Any]]:
+        """
+        チェーンIDとペアアドレスを指定してペア情報を取得します。
+        """
+        session = await self.get_session()
+        url = f"{self.base_url}/pairs/{chain_id}/{pair_address}"
+
+        try:
+            async with session.get(url, timeout=10) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    pairs = data.get("pairs") or ([data["pair"]] if data.get("pair") else [])
+                    return pairs[0] if pairs else None
+                else:
+                    print(f"Error fetching DexScreener pair {chain_id}/{pair_address}: {response.status}")
+                    return None
+        except Exception as e:
+            print(f"Exception fetching DexScreener pair {chain_id}/{pair_address}: {e}")
+            return None
+
+    async def get_token_pairs(self, token_addresses: List[str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        複数のトークンアドレス（最大 MAX_TOKENS_PER_REQUEST 件）のペアを1リクエストでまとめて取得します。
+        失敗時は None。
+        """
+        if not token_addresses:
+            return []
+        session = await self.get_session()
+        url = f"{self.base_url}/tokens/{','.join(token_addresses)}"
+
+        try:
+            async with session.get(url, timeout=10) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("pairs") or []
+                else:
+                    print(f"Error fetching DexScreener tokens ({len(token_addresses)}): {response.status}")
+                    return None
+        except Exception as e:
+            print(f"Exception fetching DexScreener tokens ({len(token_addresses)}): {e}")
+            return None
+
 dex_api = DexApi()
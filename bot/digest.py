@@ -0,0 +1,65 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+MAX_EMBEDS_PER_MESSAGE = 10 # Discordの1メッセージあたりのEmbed上限
+
+@dataclass
+class DigestItem:
+    embed: "discord.Embed"
+    chart_symbol: Optional[str] = None # チャート画像を添付するシンボル
+
+# (target_id, is_user)
+Destination = Tuple[int, bool]
+Deliver = Callable[[int, bool, List[DigestItem]], Awaitable[None]]
+
+def chunk_items(items: List[DigestItem], size: int = MAX_EMBEDS_PER_MESSAGE) -> Iterator[List[DigestItem]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def merge_pending(into: Dict[Destination, List[DigestItem]], other: Dict[Destination, List[DigestItem]]):
+    """
+    送信待ちの通知を宛先ごとに連結します（送信が遅れて複数回分溜まった時に1回で送るため）。
+    """
+    for destination, items in other.items():
+        into.setdefault(destination, []).extend(items)
+
+async def deliver_pending(pending: Dict[Destination, List[DigestItem]], deliver: Deliver):
+    """
+    宛先ごとに deliver へ渡します（宛先間は並行）。
+    """
+    if not pending:
+        return
+    results = await asyncio.gather(
+        *(deliver(target_id, is_user, items) for (target_id, is_user), items in pending.items()),
+        return_exceptions=True
+    )
+    for (target_id, _), result in zip(pending, results):
+        if isinstance(result, Exception):
+            print(f"Error delivering digest to {target_id}: {result}")
+
+class AlertDigest:
+    """
+    評価と送信の間で通知を宛先ごとにまとめます。
+    1回の判定で同じ宛先へ発生した通知は1メッセージ（複数Embed）で送ります。
+    coalesce_seconds は送信側（PriceMonitor の送信ステージ）がまとめて待つ時間です。
+    """
+    def __init__(self, coalesce_seconds: float = 0.0):
+        self.coalesce_seconds = coalesce_seconds
+        self.pending: Dict[Destination, List[DigestItem]] = {}
+
+    def add(self, target_id: int, is_user: bool, embed, chart_symbol: Optional[str] = None):
+        self.pending.setdefault((target_id, is_user), []).append(DigestItem(embed, chart_symbol))
+
+    def take(self) -> Dict[Destination, List[DigestItem]]:
+        """
+        溜まっている通知を取り出して空にします。
+        """
+        pending, self.pending = self.pending, {}
+        return pending
+
+    async def flush(self, deliver: Deliver):
+        """
+        溜まっている通知を宛先ごとに deliver へ渡します。
+        """
+        await deliver_pending(self.take(), deliver)
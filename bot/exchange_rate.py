@@ -1,34 +1,156 @@
+import asyncio
+import time
 import aiohttp
-from typing import Optional
+from typing import Dict, Optional
+from bot.circuit_breaker import breakers
+
+FX_URL = "https://api.exchangerate-api.com/v4/latest/USD"
+FALLBACK_USD_JPY = 150.0
+
+# 表示用の通貨記号（未登録の通貨はコードをそのまま表示）
+CURRENCY_SYMBOLS = {
+    "JPY": "¥",
+    "USD": "$",
+    "EUR": "€",
+    "GBP": "£",
+    "KRW": "₩",
+    "CNY": "CN¥",
+    "TWD": "NT$",
+    "HKD": "HK$",
+}
+
+def currency_symbol(currency: str) -> str:
+    return CURRENCY_SYMBOLS.get(currency.upper(), f"{currency.upper()} ")
 
 class ExchangeRateApi:
-    def __init__(self):
-        self.rate: Optional[float] = None
+    """
+    USD建ての為替レートを1レスポンスで全通貨分キャッシュします。
+
+    - 呼び出し側には常に手元の値を即座に返し（stale-while-revalidate）、
+      期限の refresh_ahead 秒前からバックグラウンドで更新します。
+    - 同時に更新が必要になっても、実行中の取得1つを全員で共有します。
+    - 初回（値が一つもない時）のみ取得完了を待ちます（最大 wait_budget 秒。取得失敗が続いている間は待たない）。
+    """
+    def __init__(self, url: str = FX_URL, update_interval: int = 3600, refresh_ahead: int = 300, wait_budget: float = 3.0):
+        self.url = url
+        self.rates: Dict[str, float] = {}
         self.last_updated: float = 0
-        self.update_interval: int = 3600  # 1時間ごとに更新
+        self.update_interval: int = update_interval  # 1時間ごとに更新
+        self.refresh_ahead: int = refresh_ahead
+        self.wait_budget: float = wait_budget
+        self.breaker = breakers.get("fx")
 
-    async def get_usd_jpy_rate(self) -> float:
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.rates.get("JPY")
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._loop_task, self._refresh_task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._loop_task, self._refresh_task) if t), return_exceptions=True)
+        self._loop_task = None
+        self._refresh_task = None
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh()
+            # 期限切れ前に更新する（失敗時は1分後、失敗が続けばブレーカーの待機時間後に再試行）
+            if self.rates and time.time() - self.last_updated < self.update_interval:
+                wait = self.last_updated + self.update_interval - self.refresh_ahead - time.time()
+                await asyncio.sleep(max(60, wait))
+            else:
+                await asyncio.sleep(max(60, self.breaker.retry_in()))
+
+    def _needs_refresh(self) -> bool:
+        return time.time() - self.last_updated >= self.update_interval - self.refresh_ahead
+
+    async def refresh(self) -> bool:
         """
-        USD/JPYのレートを取得します。キャッシュがあればそれを使います。
+        レートを取得します。取得中なら新しく取得せず、その完了を待ちます。
         """
-        import time
-        now = time.time()
-        
-        if self.rate is not None and (now - self.last_updated) < self.update_interval:
-            return self.rate
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch())
+        # 呼び出し元がキャンセルされても共有中の取得は止めない
+        return await asyncio.shield(self._refresh_task)
 
-        url = "https://api.exchangerate-api.com/v4/latest/USD"
+    async def _fetch(self) -> bool:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        self.rate = data["rates"]["JPY"]
-                        self.last_updated = now
-                        return self.rate
+            session = await self.get_session()
+            async with session.get(self.url, timeout=10) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    rates = {str(k).upper(): float(v) for k, v in data["rates"].items()}
+                    if rates:
+                        self.rates = rates
+                        self.last_updated = time.time()
+                        self.breaker.record_success()
+                        return True
+                print(f"Error fetching exchange rate: {response.status}")
         except Exception as e:
             print(f"Error fetching exchange rate: {e}")
-        
-        return self.rate if self.rate else 150.0  # フォールバック
+        self.breaker.record_failure()
+        return False
+
+    def peek_rate(self, currency: str = "JPY") -> Optional[float]:
+        """
+        キャッシュ済みの値だけを返します（取得は行わない）。
+        """
+        if currency.upper() == "USD":
+            return 1.0
+        return self.rates.get(currency.upper())
+
+    async def get_rate(self, currency: str = "JPY") -> Optional[float]:
+        """
+        USD/指定通貨 のレートを返します。未対応の通貨は None。
+        """
+        if not self.rates:
+            if self.breaker.allow():
+                try:
+                    await asyncio.wait_for(self.refresh(), timeout=self.wait_budget)
+                except asyncio.TimeoutError:
+                    # 取得自体は共有タスクとして続行し、今回はフォールバック値を使う
+                    pass
+        elif (self._needs_refresh() and self.breaker.allow()
+              and (self._refresh_task is None or self._refresh_task.done())):
+            # 古くなりかけていても待たずに手元の値を返し、裏で更新する
+            # 取得先が落ちている間（ブレーカーが開いている間）の再試行は _refresh_loop に任せる
+            self._refresh_task = asyncio.create_task(self._fetch())
+        return self.peek_rate(currency)
+
+    async def get_usd_jpy_rate(self) -> float:
+        """
+        USD/JPYのレートを取得します。キャッシュがあればそれを使います。
+        """
+        rate = await self.get_rate("JPY")
+        return rate if rate else FALLBACK_USD_JPY  # フォールバック
+
+    async def get_display_rate(self, currency: str = "JPY"):
+        """
+        表示用の (通貨コード, レート) を返します。未対応の通貨は JPY にフォールバックします。
+        """
+        rate = await self.get_rate(currency)
+        if rate is None:
+            return "JPY", await self.get_usd_jpy_rate()
+        return currency.upper(), rate
+
+    def supports(self, currency: str) -> bool:
+        currency = currency.upper()
+        return currency == "USD" or currency in self.rates
 
 exchange_rate_api = ExchangeRateApi()
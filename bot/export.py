@@ -0,0 +1,218 @@
+"""
+価格履歴を CSV または gzip圧縮NDJSON に書き出します。
+
+履歴は ティックログ（TICK_LOG_FILE）→ 監視中のメモリ内履歴 の順にジェネレーターで1件ずつ流し、
+エンコードも一定サイズのチャンク単位で行うため、期間の長さに関係なくメモリ使用量は一定です。
+NDJSON はティックログと同じ形式なので、書き出したファイルはそのまま bot.replay で再生できます。
+
+使い方:
+    python -m bot.export data/ticks.ndjson --symbol 114514USDT --format csv -o 114514.csv
+    python -m bot.export data/ticks.ndjson --symbol 114514USDT --since 2026-10-01 --format ndjson.gz -o 114514.ndjson.gz
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from bot.replay import _open_text, _parse_timestamp
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON_GZ = "ndjson.gz"
+FORMATS = (FORMAT_CSV, FORMAT_NDJSON_GZ)
+
+CHUNK_SIZE = 64 * 1024 # エンコード後、この大きさごとに書き出す
+
+# (timestamp, symbol, price, source)
+Record = Tuple[float, str, float, Optional[str]]
+
+@dataclass
+class ExportResult:
+    path: str
+    filename: str
+    rows: int
+    size: int # バイト数
+
+def iter_tick_log(path: str, symbol: Optional[str] = None,
+                  since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Record]:
+    """
+    ティックログ（NDJSON、.gz可）を1行ずつ読み、条件に合う記録を返します。
+    """
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+                ts = _parse_timestamp(str(row["ts"]))
+                record = (ts, row.get("symbol", ""), float(row["price"]), row.get("source"))
+            except (ValueError, KeyError, TypeError):
+                continue
+            if symbol is not None and record[1] != symbol:
+                continue
+            if since is not None and ts < since:
+                continue
+            if until is not None and ts > until:
+                # ログは時刻順に追記されるので、これ以降は読まなくてよい
+                break
+            yield record
+
+def iter_history(symbol: str, memory: Iterable[Tuple[float, float, str]],
+                 tick_log_path: Optional[str] = None,
+                 since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Record]:
+    """
+    ティックログとメモリ内履歴を時刻順につなげて返します。
+    両方にある期間はメモリ内履歴（klines補完を含む）を優先し、ログはその手前までだけ読みます。
+    """
+    memory = list(memory)
+    memory_start = memory[0][0] if memory else None
+
+    if tick_log_path and os.path.exists(tick_log_path):
+        for record in iter_tick_log(tick_log_path, symbol, since, until):
+            if memory_start is not None and record[0] >= memory_start:
+                break
+            yield record
+
+    for ts, price, source in memory:
+        if since is not None and ts < since:
+            continue
+        if until is not None and ts > until:
+            break
+        yield ts, symbol, price, source
+
+def _format_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+def encode_csv(records: Iterable[Record], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    timestamp(ISO 8601, UTC),symbol,price,source の CSV をチャンク単位で返します。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["timestamp", "symbol", "price", "source"])
+    for ts, symbol, price, source in records:
+        writer.writerow([_format_iso(ts), symbol, repr(price), source or ""])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def encode_ndjson_gz(records: Iterable[Record], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    ティックログと同じ形式のNDJSONを gzip 圧縮しながらチャンク単位で返します。
+    """
+    # wbits=31: gzipヘッダー付きで出力する（gzip.open や bot.replay でそのまま読める）
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending: List[str] = []
+    pending_size = 0
+    for ts, symbol, price, source in records:
+        line = json.dumps({"ts": ts, "symbol": symbol, "price": price, "source": source}) + "\n"
+        pending.append(line)
+        pending_size += len(line)
+        if pending_size >= chunk_size:
+            data = compressor.compress("".join(pending).encode("utf-8"))
+            pending, pending_size = [], 0
+            if data:
+                yield data
+    if pending:
+        data = compressor.compress("".join(pending).encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def encode(records: Iterable[Record], fmt: str) -> Iterator[bytes]:
+    if fmt == FORMAT_CSV:
+        return encode_csv(records)
+    if fmt == FORMAT_NDJSON_GZ:
+        return encode_ndjson_gz(records)
+    raise ValueError(f"未対応の形式です: {fmt}")
+
+class _Counter:
+    """
+    ジェネレーターを通過した記録数を数えます。
+    """
+    def __init__(self, records: Iterable[Record]):
+        self.records = records
+        self.rows = 0
+
+    def __iter__(self) -> Iterator[Record]:
+        for record in self.records:
+            self.rows += 1
+            yield record
+
+def write_chunks(chunks: Iterable[bytes], f: BinaryIO) -> int:
+    size = 0
+    for chunk in chunks:
+        f.write(chunk)
+        size += len(chunk)
+    return size
+
+def export_filename(symbol: str, fmt: str, since: Optional[float], until: Optional[float]) -> str:
+    def stamp(ts: Optional[float]) -> str:
+        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y%m%dT%H%M") if ts else "all"
+    return f"{symbol}_{stamp(since)}-{stamp(until)}.{fmt}"
+
+def export_to_file(records: Iterable[Record], fmt: str, filename: str) -> ExportResult:
+    """
+    一時ファイルに書き出します（呼び出し側で不要になったら削除すること）。
+    """
+    counter = _Counter(records)
+    fd, path = tempfile.mkstemp(prefix="export_", suffix="." + fmt)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            size = write_chunks(encode(counter, fmt), f)
+    except Exception:
+        os.remove(path)
+        raise
+    return ExportResult(path=path, filename=filename, rows=counter.rows, size=size)
+
+async def export_history(symbol: str, fmt: str,
+                         since: Optional[float] = None, until: Optional[float] = None) -> ExportResult:
+    """
+    監視中の履歴（ティックログ設定時はログも）を一時ファイルへ書き出します。
+    読み込み・エンコード・書き込みは別スレッドで行い、イベントループを止めません。
+    """
+    from bot.monitor import monitor
+
+    # メモリ内履歴は監視tickが更新するので、ここ（ループ上）で写しを取ってからスレッドへ渡す（最大60分分）
+    memory = list(monitor.price_history.get(symbol, ()))
+    records = iter_history(symbol, memory, monitor.tick_log_path, since, until)
+    filename = export_filename(symbol, fmt, since, until)
+    return await asyncio.to_thread(export_to_file, records, fmt, filename)
+
+def _parse_time_arg(value: Optional[str]) -> Optional[float]:
+    return _parse_timestamp(value) if value else None
+
+def main():
+    parser = argparse.ArgumentParser(description="ティックログから価格履歴を CSV / gzip NDJSON で書き出します")
+    parser.add_argument("path", nargs="?", default=os.getenv("TICK_LOG_FILE"), help="ティックログ (.ndjson、.gz可。省略時は TICK_LOG_FILE)")
+    parser.add_argument("--symbol", required=True, help="対象シンボル 例: 114514USDT")
+    parser.add_argument("--format", choices=FORMATS, default=FORMAT_CSV, help="出力形式")
+    parser.add_argument("--since", help="開始時刻（UNIX秒 または ISO 8601）")
+    parser.add_argument("--until", help="終了時刻（UNIX秒 または ISO 8601）")
+    parser.add_argument("-o", "--output", help="出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.error("ティックログのパスを指定するか、TICK_LOG_FILE を設定してください")
+
+    records = _Counter(iter_history(args.symbol.upper(), [], args.path, _parse_time_arg(args.since), _parse_time_arg(args.until)))
+    chunks = encode(records, args.format)
+    if args.output:
+        with open(args.output, "wb") as f:
+            size = write_chunks(chunks, f)
+        print(f"{records.rows} rows, {size:,} bytes -> {args.output}", file=sys.stderr)
+    else:
+        write_chunks(chunks, sys.stdout.buffer)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+from collections import deque
+from typing import Deque, Dict, Mapping, Optional, Set, Tuple
+
+class WindowExtremes:
+    """
+    直近 window_minutes 分の高値・安値を単調デックで保持します（追加・削除とも償却 O(1)）。
+
+    - _max: 価格が単調減少するデック。先頭が窓内の高値
+    - _min: 価格が単調増加するデック。先頭が窓内の安値
+    """
+    def __init__(self, window_minutes: int):
+        self.window_minutes = window_minutes
+        self._max: Deque[Tuple[float, float]] = deque()
+        self._min: Deque[Tuple[float, float]] = deque()
+        self.first_ts: Optional[float] = None
+        # 直近のサンプルが、それより前の窓内高値を上回ったか
+        self.breakout = False
+
+    @property
+    def high(self) -> Optional[float]:
+        return self._max[0][1] if self._max else None
+
+    @property
+    def low(self) -> Optional[float]:
+        return self._min[0][1] if self._min else None
+
+    @property
+    def covered(self) -> bool:
+        """
+        窓全体分の履歴がそろっているか（起動直後に「高値更新」を連発しないように使う）。
+        """
+        if self.first_ts is None or not self._max:
+            return False
+        # 1サンプル分（tick間隔程度）の不足は許容する
+        return self._max[-1][0] - self.first_ts >= self.window_minutes * 60 - 60
+
+    def push(self, ts: float, price: float):
+        self.evict(ts - self.window_minutes * 60)
+        previous_high = self.high
+        if self.first_ts is None:
+            self.first_ts = ts
+
+        while self._max and self._max[-1][1] <= price:
+            self._max.pop()
+        self._max.append((ts, price))
+        while self._min and self._min[-1][1] >= price:
+            self._min.pop()
+        self._min.append((ts, price))
+
+        self.breakout = previous_high is not None and price > previous_high and self.covered
+
+    def evict(self, cutoff: float):
+        while self._max and self._max[0][0] < cutoff:
+            self._max.popleft()
+        while self._min and self._min[0][0] < cutoff:
+            self._min.popleft()
+
+    def drawdown_percent(self, price: float) -> Optional[float]:
+        """
+        窓内高値からの下落率(%)。高値と同値なら0。
+        """
+        high = self.high
+        if not high:
+            return None
+        return max(0.0, (high - price) / high * 100)
+
+class ExtremesTracker:
+    """
+    シンボル・時間窓ごとの WindowExtremes を保持します。
+    """
+    def __init__(self):
+        # symbol -> 集計する時間窓
+        self.windows: Dict[str, Set[int]] = {}
+        self.extremes: Dict[Tuple[str, int], WindowExtremes] = {}
+
+    def set_windows(self, windows: Mapping[str, Set[int]]):
+        self.windows = {symbol: set(ws) for symbol, ws in windows.items() if ws}
+        for key in [k for k in self.extremes if k[1] not in self.windows.get(k[0], ())]:
+            del self.extremes[key]
+
+    def reset(self, symbol: str):
+        for key in [k for k in self.extremes if k[0] == symbol]:
+            del self.extremes[key]
+
+    def observe(self, symbol: str, ts: float, price: float):
+        for window in self.windows.get(symbol, ()):
+            extremes = self.extremes.get((symbol, window))
+            if extremes is None:
+                extremes = self.extremes[(symbol, window)] = WindowExtremes(window)
+            extremes.push(ts, price)
+
+    def get(self, symbol: str, window: int) -> Optional[WindowExtremes]:
+        return self.extremes.get((symbol, window))
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from bot.dex_api import dex_api, MAX_TOKENS_PER_REQUEST
+from bot.circuit_breaker import breakers
+from bot.digest import AlertDigest
+
+LIQUIDITY_WATCH_FILE = "data/liquidity_watch.json"
+MAX_WATCHES_PER_TARGET = 20
+
+@dataclass
+class RiskBand:
+    level: int # 0: 健全 〜 3: 非常に危険
+    label: str
+    color: int
+    comment: str
+
+# 比率がこれを超えると1段階上のリスク帯（健全 / 普通 / 危険 / 非常に危険）
+RISK_BOUNDARIES = (5, 20, 50)
+# ウォッチの帯の変更には境界からこの割合だけ離れることを求める（境界付近での通知の往復を防ぐ）
+RISK_HYSTERESIS = 0.1
+
+def risk_level(ratio: float) -> int:
+    return sum(1 for boundary in RISK_BOUNDARIES if ratio > boundary)
+
+def risk_band(ratio: float, level: Optional[int] = None) -> RiskBand:
+    """
+    時価総額/流動性の比率からリスク帯を判定します（/check と流動性ウォッチで共通）。
+    level を指定するとその帯の表示で返します（ヒステリシスで帯を据え置いた場合）。
+    """
+    if level is None:
+        level = risk_level(ratio)
+    if level >= 3:
+        return RiskBand(3, "🔥 非常に危険 (Very High Risk)", 0xff0000,
+                        f"時価総額が流動性の**{ratio:.0f}倍**もあります。非常に流動性が薄く、売り圧で暴落しやすい状態です。")
+    if level == 2:
+        return RiskBand(2, "⚠️ 危険 (High Risk)", 0xe67e22,
+                        f"時価総額が流動性の{ratio:.0f}倍です。ボラティリティが高くなる傾向があります。")
+    if level == 1:
+        return RiskBand(1, "🤔 普通 (Medium)", 0xf1c40f, "ミームコインとしては一般的な水準です。")
+    return RiskBand(0, "✅ 健全 (Good)", 0x2ecc71, "時価総額に対して十分な流動性があります。")
+
+def settle_level(ratio: float, last_level: Optional[int], margin: float = RISK_HYSTERESIS) -> int:
+    """
+    前回の帯から、境界を margin 以上越えた場合だけ帯を移します。
+    例: 「危険」(20〜50倍) から「非常に危険」へは55倍超、「普通」へは18倍以下で移る。
+    """
+    level = risk_level(ratio)
+    if last_level is None or level == last_level:
+        return level
+    if level > last_level:
+        return max([last_level] + [k + 1 for k, boundary in enumerate(RISK_BOUNDARIES)
+                                   if k >= last_level and ratio > boundary * (1 + margin)])
+    return min([last_level] + [k for k, boundary in enumerate(RISK_BOUNDARIES)
+                               if k < last_level and ratio <= boundary * (1 - margin)])
+
+def classify_risk(market_cap: float, liquidity: float) -> Tuple[float, RiskBand]:
+    """
+    戻り値: (時価総額/流動性の比率, リスク帯)
+    """
+    ratio = market_cap / liquidity if liquidity > 0 else 0
+    return ratio, risk_band(ratio)
+
+def pair_metrics(pair: Dict[str, Any]) -> Tuple[float, float, float]:
+    """
+    DexScreenerのペア情報から (価格USD, 流動性USD, 時価総額USD) を取り出します。
+    時価総額がなければFDVを使います。
+    """
+    price_usd = float(pair.get("priceUsd", 0) or 0)
+    liquidity = float((pair.get("liquidity") or {}).get("usd", 0) or 0)
+    market_cap = float(pair.get("marketCap", 0) or pair.get("fdv", 0) or 0)
+    return price_usd, liquidity, market_cap
+
+@dataclass
+class LiquidityWatch:
+    target_id: int # channel_id または user_id
+    is_user: bool
+    token_address: str
+    chain_id: str
+    symbol: str
+    name: str = ""
+    url: str = ""
+    last_level: Optional[int] = None # 前回のリスク帯（未取得なら None）
+    last_ratio: float = 0.0
+
+    @property
+    def key(self) -> Tuple[int, bool, str]:
+        return (self.target_id, self.is_user, self.token_address)
+
+class LiquidityMonitor:
+    """
+    ウォッチ中のトークンの時価総額/流動性比率を定期的に取得し、リスク帯が変わったら通知します。
+
+    DexScreenerの /tokens エンドポイントに最大30アドレスずつまとめて問い合わせるため、
+    リクエスト数はウォッチ数ではなくバッチ数（トークン数/30）に比例します。
+    同じトークンを複数の宛先がウォッチしていても取得は1回です。
+    """
+    def __init__(self, path: str = LIQUIDITY_WATCH_FILE, interval: float = 60, batch_size: int = MAX_TOKENS_PER_REQUEST):
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.watches: Dict[Tuple[int, bool, str], LiquidityWatch] = {}
+        self.digest = AlertDigest()
+
+        self.last_poll: float = 0.0
+        self.last_requests = 0
+        self.last_tokens = 0
+
+        self._task: Optional[asyncio.Task] = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for item in json.load(f):
+                    watch = LiquidityWatch(**item)
+                    self.watches[watch.key] = watch
+        except Exception as e:
+            print(f"Error loading liquidity watches: {e}")
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump([asdict(w) for w in self.watches.values()], f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"Error saving liquidity watches: {e}")
+
+    def get_watches(self, target_id: int, is_user: bool) -> List[LiquidityWatch]:
+        return [w for w in self.watches.values() if w.target_id == target_id and w.is_user == is_user]
+
+    def add_watch(self, target_id: int, is_user: bool, pair: Dict[str, Any]) -> LiquidityWatch:
+        base_token = pair.get("baseToken", {})
+        address = base_token.get("address")
+        if not address:
+            raise ValueError("トークンアドレスを取得できませんでした。")
+        existing = self.watches.get((target_id, is_user, address))
+        if existing is None and len(self.get_watches(target_id, is_user)) >= MAX_WATCHES_PER_TARGET:
+            raise ValueError(f"ウォッチできるトークンは最大{MAX_WATCHES_PER_TARGET}件です。")
+
+        _, liquidity, market_cap = pair_metrics(pair)
+        ratio, band = classify_risk(market_cap, liquidity)
+        watch = LiquidityWatch(
+            target_id=target_id,
+            is_user=is_user,
+            token_address=address,
+            chain_id=pair.get("chainId", ""),
+            symbol=base_token.get("symbol", ""),
+            name=base_token.get("name", ""),
+            url=pair.get("url", ""),
+            # 登録時点の帯を基準にし、そこから変わった時に通知する
+            last_level=band.level if liquidity > 0 else None,
+            last_ratio=ratio
+        )
+        self.watches[watch.key] = watch
+        self.save()
+        return watch
+
+    def remove_watch(self, target_id: int, is_user: bool, query: str) -> Optional[LiquidityWatch]:
+        query = query.strip()
+        for watch in self.get_watches(target_id, is_user):
+            if watch.token_address.lower() == query.lower() or watch.symbol.upper() == query.upper():
+                del self.watches[watch.key]
+                self.save()
+                return watch
+        return None
+
+    def start(self, bot):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(bot))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self, bot):
+        from bot.monitor import monitor
+
+        while True:
+            try:
+                if await self.poll():
+                    # 通知は価格アラートと同じ経路（宛先ごとにまとめて送信キューへ）で送る
+                    await self.digest.flush(
+                        lambda target_id, is_user, items: monitor._deliver_digest(bot, target_id, is_user, items, {})
+                    )
+            except Exception as e:
+                print(f"Error in liquidity monitor: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def fetch_pairs(self, token_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        トークンアドレス -> 最も流動性の高いペア。batch_size 件ずつ並行して取得します。
+        """
+        batches = [token_addresses[i:i + self.batch_size] for i in range(0, len(token_addresses), self.batch_size)]
+        breaker = breakers.get("dexscreener-tokens")
+        if not breaker.allow() and not breaker.probe_due():
+            self.last_requests = 0
+            return {}
+
+        results = await asyncio.gather(*(dex_api.get_token_pairs(batch) for batch in batches))
+        self.last_requests = len(batches)
+
+        best: Dict[str, Dict[str, Any]] = {}
+        failed = 0
+        for pairs in results:
+            if pairs is None:
+                failed += 1
+                continue
+            for pair in pairs:
+                address = pair.get("baseToken", {}).get("address")
+                if not address:
+                    continue
+                _, liquidity, _ = pair_metrics(pair)
+                current = best.get(address.lower())
+                if current is None or liquidity > pair_metrics(current)[1]:
+                    best[address.lower()] = pair
+
+        if failed == len(batches):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return best
+
+    async def poll(self) -> bool:
+        """
+        全ウォッチを1巡評価します。通知が発生したら True。
+        """
+        addresses = sorted({w.token_address for w in self.watches.values()})
+        self.last_tokens = len(addresses)
+        if not addresses:
+            return False
+
+        pairs = await self.fetch_pairs(addresses)
+        self.last_poll = time.time()
+
+        changed = False
+        for watch in list(self.watches.values()):
+            pair = pairs.get(watch.token_address.lower())
+            if pair is None:
+                continue
+            price_usd, liquidity, market_cap = pair_metrics(pair)
+            if liquidity <= 0:
+                continue
+            ratio, _ = classify_risk(market_cap, liquidity)
+            previous = watch.last_level
+            level = settle_level(ratio, previous)
+            band = risk_band(ratio, level)
+            watch.last_level = level
+            watch.last_ratio = ratio
+            changed = changed or previous != level
+            if previous is not None and previous != level:
+                self._notify(watch, previous, band, ratio, price_usd, liquidity, market_cap)
+
+        if changed:
+            self.save()
+        return bool(self.digest.pending)
+
+    def _notify(self, watch: LiquidityWatch, previous: int, band: RiskBand, ratio: float,
+                price_usd: float, liquidity: float, market_cap: float):
+        direction = "悪化" if band.level > previous else "改善"
+        embed_dict = {
+            "title": f"🛡️ {watch.symbol} 流動性リスクが{direction}しました",
+            "description": f"判定: **{band.label}**\n{band.comment}",
+            "color": band.color,
+            "url": watch.url or None,
+            "fields": [
+                {"name": "MCap / Liq 比率", "value": f"**{ratio:.1f}倍**", "inline": True},
+                {"name": "時価総額 (MCap)", "value": f"${market_cap:,.0f}", "inline": True},
+                {"name": "流動性 (Liquidity)", "value": f"${liquidity:,.0f}", "inline": True},
+                {"name": "現在価格", "value": f"${price_usd:.8f}", "inline": True},
+            ],
+            "footer": {"text": "Data provided by DexScreener"}
+        }
+        from discord import Embed
+        self.digest.add(watch.target_id, watch.is_user, Embed.from_dict(embed_dict))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "watches": len(self.watches),
+            "tokens": self.last_tokens,
+            "requests": self.last_requests,
+            "last_poll": self.last_poll,
+        }
+
+liquidity_monitor = LiquidityMonitor()
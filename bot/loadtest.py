@@ -0,0 +1,404 @@
+"""
+スラッシュコマンドの負荷試験ハーネス。
+
+登録済みのコマンドのコールバックを偽の Interaction で同時に呼び出し、
+MEXC・DexScreener・為替・QuickChart はローカルのスタンドインサーバーに向けて計測します。
+Discordには接続せず、data/ の設定ファイルも書き換えません（一時ディレクトリを使用）。
+
+出力:
+    - コマンドごとの初回応答（defer / send_message）と最終応答（followup）までの p50/p99
+    - 外部APIごとのリクエスト数
+    - イベントループの遅延（p50/p99/max）
+
+使い方:
+    python -m bot.loadtest --requests 500 --concurrency 200
+    python -m bot.loadtest --commands status,check --latency 300 --chart-latency 1500
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+COMMANDS = ("status", "calc", "check", "dm_config")
+DEFAULT_SYMBOL = "114514USDT"
+
+# Discordは3秒以内に初回応答がないとインタラクションを失敗扱いにする
+ACK_LIMIT = 3.0
+
+# 1x1の透明PNG（QuickChartスタンドインの応答）
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+class StandInServer:
+    """
+    外部APIのローカルスタンドイン。レイテンシ（ジッター付き）を模擬し、宛先ごとにリクエスト数を数えます。
+    """
+    def __init__(self, latency: float = 0.1, chart_latency: float = 0.5, jitter: float = 0.5):
+        self.latency = latency
+        self.chart_latency = chart_latency
+        self.jitter = jitter
+        self.counts: Counter = Counter()
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+        self._price = 0.0123
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/mexc/api/v3/ticker/price", self._ticker)
+        app.router.add_get("/mexc/api/v3/klines", self._klines)
+        app.router.add_get("/mexc/api/v3/exchangeInfo", self._exchange_info)
+        app.router.add_get("/dex/search", self._dex_search)
+        app.router.add_get("/dex/pairs/{chain}/{address}", self._dex_pair)
+        app.router.add_get("/fx/latest/USD", self._fx)
+        app.router.add_post("/chart", self._chart)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _delay(self, name: str, base: float):
+        self.counts[name] += 1
+        await asyncio.sleep(base * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _next_price(self) -> float:
+        self._price *= random.uniform(0.98, 1.02)
+        return self._price
+
+    async def _ticker(self, request: web.Request):
+        await self._delay("mexc", self.latency)
+        symbol = request.query.get("symbol", "")
+        if not symbol:
+            return web.json_response([{"symbol": DEFAULT_SYMBOL, "price": f"{self._next_price():.8f}"}])
+        if symbol.startswith("NOPE"):
+            return web.json_response({"code": -1121, "msg": "Invalid symbol."}, status=400)
+        return web.json_response({"symbol": symbol, "price": f"{self._next_price():.8f}"})
+
+    async def _klines(self, request: web.Request):
+        await self._delay("mexc", self.latency)
+        limit = int(request.query.get("limit", 60))
+        now_ms = int(time.time() // 60 * 60 * 1000)
+        rows = []
+        for i in range(limit, 0, -1):
+            close_time = now_ms - i * 60000
+            price = f"{self._next_price():.8f}"
+            rows.append([close_time - 60000, price, price, price, price, "0", close_time, "0"])
+        return web.json_response(rows)
+
+    async def _exchange_info(self, request: web.Request):
+        await self._delay("mexc", self.latency)
+        return web.json_response({"symbols": [{"symbol": DEFAULT_SYMBOL, "baseAsset": "114514", "quoteAsset": "USDT"}]})
+
+    def _pair(self, symbol: str) -> Dict[str, Any]:
+        return {
+            "chainId": "solana",
+            "pairAddress": f"PAIR{symbol}",
+            "url": f"https://dexscreener.com/solana/PAIR{symbol}",
+            "baseToken": {"name": symbol, "symbol": symbol},
+            "priceUsd": f"{self._next_price():.8f}",
+            "liquidity": {"usd": random.uniform(5e4, 5e5)},
+            "marketCap": random.uniform(1e6, 2e7),
+        }
+
+    async def _dex_search(self, request: web.Request):
+        await self._delay("dexscreener", self.latency)
+        return web.json_response({"pairs": [self._pair(request.query.get("q", "114514").upper())]})
+
+    async def _dex_pair(self, request: web.Request):
+        await self._delay("dexscreener", self.latency)
+        return web.json_response({"pairs": [self._pair(request.match_info["address"][len("PAIR"):])]})
+
+    async def _fx(self, request: web.Request):
+        await self._delay("fx", self.latency)
+        return web.json_response({"base": "USD", "rates": {"USD": 1.0, "JPY": 150.0, "EUR": 0.92, "GBP": 0.79}})
+
+    async def _chart(self, request: web.Request):
+        await request.read()
+        await self._delay("quickchart", self.chart_latency)
+        return web.Response(body=PNG_BYTES, content_type="image/png")
+
+@dataclass
+class Timing:
+    command: str
+    started: float
+    acked: Optional[float] = None # defer または send_message
+    completed: Optional[float] = None # 最後の応答
+    error: Optional[str] = None
+
+class _FakeResponse:
+    def __init__(self, timing: Timing, discord_latency: float):
+        self.timing = timing
+        self.discord_latency = discord_latency
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _ack(self):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to before")
+        await asyncio.sleep(self.discord_latency)
+        self._done = True
+        self.timing.acked = time.monotonic()
+
+    async def defer(self, *args, **kwargs):
+        await self._ack()
+
+    async def send_message(self, *args, **kwargs):
+        await self._ack()
+        self.timing.completed = self.timing.acked
+
+class _FakeFollowup:
+    def __init__(self, timing: Timing, discord_latency: float):
+        self.timing = timing
+        self.discord_latency = discord_latency
+
+    async def send(self, *args, **kwargs):
+        if self.timing.acked is None:
+            raise RuntimeError("Interaction must be deferred before sending a followup")
+        await asyncio.sleep(self.discord_latency)
+        self.timing.completed = time.monotonic()
+
+@dataclass
+class _FakePermissions:
+    administrator: bool = False
+    manage_channels: bool = False
+
+@dataclass
+class _FakeUser:
+    id: int
+    guild_permissions: _FakePermissions = field(default_factory=_FakePermissions)
+
+@dataclass
+class _FakeGuild:
+    id: int
+
+class FakeInteraction:
+    """
+    コマンドのコールバックが使う属性だけを持つ偽の discord.Interaction。
+    """
+    def __init__(self, timing: Timing, user_id: int, channel_id: Optional[int], guild_id: Optional[int], discord_latency: float = 0.0):
+        self.user = _FakeUser(user_id)
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.guild = _FakeGuild(guild_id) if guild_id else None
+        self.response = _FakeResponse(timing, discord_latency)
+        self.followup = _FakeFollowup(timing, discord_latency)
+
+class LoopLagMonitor:
+    """
+    一定間隔で sleep し、予定時刻からの遅れをイベントループの遅延として記録します。
+    """
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.monotonic() - expected))
+
+def _point_at(base_url: str):
+    """
+    外部APIクライアントのシングルトンをスタンドインに向けます。
+    """
+    from bot.mexc_api import mexc_api
+    from bot.dex_api import dex_api
+    from bot.exchange_rate import exchange_rate_api
+    from bot.monitor import monitor
+
+    mexc_api.base_url = f"{base_url}/mexc"
+    dex_api.base_url = f"{base_url}/dex"
+    exchange_rate_api.url = f"{base_url}/fx/latest/USD"
+    monitor.chart_url = f"{base_url}/chart"
+
+def _isolate_data(directory: str):
+    """
+    コマンドが保存する設定ファイルを一時ディレクトリに向けます。
+    """
+    import bot.config_store as config_store_module
+
+    config_store_module.CONFIG_FILE = os.path.join(directory, "config.json")
+    config_store_module.USER_CONFIG_FILE = os.path.join(directory, "user_config.json")
+
+def _seed_history(symbol: str, minutes: int = 60):
+    # /status のチャート描画と変動率表示が走るように履歴を入れておく
+    from bot.monitor import monitor
+
+    now = time.time()
+    price = 0.0123
+    for i in range(minutes * 4, 0, -1):
+        price *= random.uniform(0.99, 1.01)
+        monitor._add_history(symbol, price, now=now - i * 15)
+
+def _build_invocations(tree) -> Dict[str, Callable[[FakeInteraction, int], Any]]:
+    status = tree.get_command("status")
+    calc = tree.get_command("calc")
+    check = tree.get_command("check")
+    dm_config = tree.get_command("dm").get_command("config")
+
+    return {
+        "status": lambda interaction, i: status.callback(interaction),
+        "calc": lambda interaction, i: calc.callback(interaction, amount=random.uniform(1, 1e6)),
+        "check": lambda interaction, i: check.callback(interaction, symbol=random.choice([None, "114514", "PEPE"])),
+        "dm_config": lambda interaction, i: dm_config.callback(
+            interaction, symbol=DEFAULT_SYMBOL, threshold_percent=random.choice([1.0, 2.0, 5.0]), currency="USD"
+        ),
+    }
+
+async def run_load(commands: List[str], requests: int, concurrency: int, latency: float, chart_latency: float,
+                   discord_latency: float = 0.0, seed: Optional[int] = None) -> Dict[str, Any]:
+    import discord
+    from discord import app_commands
+    from bot.commands import setup_commands
+    from bot.mexc_api import mexc_api
+    from bot.dex_api import dex_api
+    from bot.exchange_rate import exchange_rate_api
+
+    rng_seed = seed if seed is not None else int(time.time())
+    random.seed(rng_seed)
+
+    server = StandInServer(latency=latency, chart_latency=chart_latency)
+    await server.start()
+    _point_at(server.base_url)
+    _seed_history(DEFAULT_SYMBOL)
+
+    client = discord.Client(intents=discord.Intents.default())
+    tree = app_commands.CommandTree(client)
+    setup_commands(tree, client)
+    invocations = _build_invocations(tree)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: List[Timing] = []
+
+    async def invoke(i: int):
+        command = commands[i % len(commands)]
+        async with semaphore:
+            timing = Timing(command=command, started=time.monotonic())
+            timings.append(timing)
+            # 半分はサーバーのチャンネル、半分はDMから実行する
+            in_guild = command != "dm_config" and i % 2 == 0
+            interaction = FakeInteraction(
+                timing,
+                user_id=10_000 + i,
+                channel_id=20_000 + i % 50 if in_guild else None,
+                guild_id=1 if in_guild else None,
+                discord_latency=discord_latency
+            )
+            try:
+                await invocations[command](interaction, i)
+            except Exception as e:
+                timing.error = f"{type(e).__name__}: {e}"
+
+    lag = LoopLagMonitor()
+    lag.start()
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(invoke(i) for i in range(requests)))
+    finally:
+        elapsed = time.monotonic() - started
+        await lag.stop()
+        await mexc_api.close()
+        await dex_api.close()
+        await exchange_rate_api.stop()
+        await server.stop()
+
+    return {
+        "seed": rng_seed,
+        "elapsed": elapsed,
+        "timings": timings,
+        "upstream": dict(server.counts),
+        "loop_lag": lag.samples,
+    }
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+def print_report(report: Dict[str, Any]):
+    timings: List[Timing] = report["timings"]
+    print(f"seed={report['seed']}  {len(timings)} requests in {report['elapsed']:.2f}s "
+          f"({len(timings) / max(report['elapsed'], 1e-9):.1f} req/s)")
+    print()
+    print(f"{'command':<12}{'count':>7}{'errors':>8}{'ack p50':>10}{'ack p99':>10}{'>3s':>6}{'done p50':>10}{'done p99':>10}")
+    for command in sorted({t.command for t in timings}):
+        rows = [t for t in timings if t.command == command]
+        acks = [t.acked - t.started for t in rows if t.acked is not None]
+        dones = [t.completed - t.started for t in rows if t.completed is not None]
+        errors = sum(1 for t in rows if t.error or t.completed is None)
+        late = sum(1 for a in acks if a > ACK_LIMIT)
+        print(f"{command:<12}{len(rows):>7}{errors:>8}{_fmt(_percentile(acks, 0.5)):>10}{_fmt(_percentile(acks, 0.99)):>10}"
+              f"{late:>6}{_fmt(_percentile(dones, 0.5)):>10}{_fmt(_percentile(dones, 0.99)):>10}")
+
+    failures = [t for t in timings if t.error]
+    if failures:
+        print()
+        for error, count in Counter(t.error for t in failures).most_common(5):
+            print(f"  {count}x {error}")
+
+    print()
+    print("upstream requests: " + (", ".join(f"{name}={count}" for name, count in sorted(report["upstream"].items())) or "none"))
+    lag = report["loop_lag"]
+    print(f"event loop lag: p50 {_fmt(_percentile(lag, 0.5))} / p99 {_fmt(_percentile(lag, 0.99))} / max {_fmt(max(lag) if lag else None)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="スラッシュコマンドを同時実行して応答時間を計測します")
+    parser.add_argument("--commands", default=",".join(COMMANDS), help=f"実行するコマンドのカンマ区切り（{', '.join(COMMANDS)}）")
+    parser.add_argument("--requests", type=int, default=200, help="総実行回数")
+    parser.add_argument("--concurrency", type=int, default=100, help="同時実行数")
+    parser.add_argument("--latency", type=float, default=100, help="外部APIスタンドインの平均レイテンシ（ミリ秒）")
+    parser.add_argument("--chart-latency", type=float, default=500, help="QuickChartスタンドインの平均レイテンシ（ミリ秒）")
+    parser.add_argument("--discord-latency", type=float, default=0, help="Discordへの応答1回あたりのレイテンシ（ミリ秒）")
+    parser.add_argument("--seed", type=int, help="乱数シード")
+    args = parser.parse_args()
+
+    commands = [c.strip() for c in args.commands.split(",") if c.strip()]
+    unknown = [c for c in commands if c not in COMMANDS]
+    if unknown or not commands:
+        parser.error(f"unknown commands: {', '.join(unknown) or '(none)'}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        _isolate_data(directory)
+        report = asyncio.run(run_load(
+            commands,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            latency=args.latency / 1000,
+            chart_latency=args.chart_latency / 1000,
+            discord_latency=args.discord_latency / 1000,
+            seed=args.seed
+        ))
+    print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,134 @@
 import discord
 from discord import app_commands
 import os
+import json
+import time
+import hashlib
 import asyncio
+from typing import Dict, Optional
 from dotenv import load_dotenv
 from bot.commands import setup_commands
 from bot.monitor import monitor
 from bot.mexc_api import mexc_api
+from bot.outbound import outbound_queue
+from bot.symbol_catalog import symbol_catalog
+from bot.exchange_rate import exchange_rate_api
+from bot.dex_api import dex_api
+from bot.liquidity import liquidity_monitor
+
+# 起動時刻（コールドスタートから ready までの計測用）
+START_TIME = time.perf_counter()
 
 # .env読み込み
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_TOKEN")
+# 開発用: 指定するとそのギルドにのみ即時同期する
+DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")
+# 1 にするとハッシュが一致していても同期する
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC") == "1"
+
+COMMAND_SYNC_FILE = "data/command_sync.json"
+
+def load_sync_state() -> Dict[str, str]:
+    if not os.path.exists(COMMAND_SYNC_FILE):
+        return {}
+    try:
+        with open(COMMAND_SYNC_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading command sync state: {e}")
+        return {}
+
+def save_sync_state(state: Dict[str, str]):
+    try:
+        os.makedirs(os.path.dirname(COMMAND_SYNC_FILE), exist_ok=True)
+        with open(COMMAND_SYNC_FILE, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+    except Exception as e:
+        print(f"Error saving command sync state: {e}")
+
+def command_tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """
+    登録済みコマンド定義（Discordへ送るペイロード）のハッシュを返します。
+    """
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:
+            # discord.py 2.3 以前は引数なし
+            payload.append(command.to_dict())
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
 
 class MexcBot(discord.Client):
     def __init__(self):
         intents = discord.Intents.default()
-        super().__init__(intents=intents)
+        # 長いレート制限で内部待機せず discord.RateLimited を送出させ、送信キュー側で後回しにする
+        super().__init__(intents=intents, max_ratelimit_timeout=30.0)
         self.tree = app_commands.CommandTree(self)
+        self.ready_logged = False
 
     async def setup_hook(self):
         # コマンドの登録
         setup_commands(self.tree, self)
-        
-        # グローバルコマンドとして同期（即時反映にはギルド指定が必要だが、汎用のためグローバルで）
-        # 開発中は特定のギルドIDを指定してsyncすると早い
-        # await self.tree.sync(guild=discord.Object(id=YOUR_GUILD_ID))
-        await self.tree.sync()
-        print("Commands synced.")
-        
-        # 監視タスク開始
+        await self.sync_commands()
+
+        # シンボルカタログ・為替レート（バックグラウンドで定期更新）、Discordへの書き込みキューと監視タスク開始
+        symbol_catalog.start()
+        exchange_rate_api.start()
+        outbound_queue.start()
         self.loop.create_task(monitor.start(self))
+        liquidity_monitor.start(self)
+
+    async def sync_commands(self):
+        """
+        コマンド定義が前回同期時から変わっている場合のみ同期します。
+        tree.sync() はレート制限の厳しいグローバルAPIなので、再起動のたびに呼ばないようにする。
+        """
+        guild = discord.Object(id=int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+        if guild:
+            # 開発中は特定のギルドにコピーして同期すると即時反映される
+            self.tree.copy_global_to(guild=guild)
+
+        key = f"guild:{guild.id}" if guild else "global"
+        digest = command_tree_hash(self.tree, guild)
+        state = load_sync_state()
+
+        if not FORCE_COMMAND_SYNC and state.get(key) == digest:
+            print(f"Commands unchanged ({key}), skipping sync.")
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.tree.sync(guild=guild)
+        except Exception as e:
+            # 同期に失敗してもBot自体は起動を続け、次回起動時に再試行する
+            print(f"Error syncing commands ({key}): {e}")
+            return
+
+        state[key] = digest
+        save_sync_state(state)
+        print(f"Commands synced ({key}) in {time.perf_counter() - started:.2f}s.")
 
     async def on_ready(self):
         print(f'Logged in as {self.user} (ID: {self.user.id})')
+        if not self.ready_logged:
+            # 再接続時の on_ready は計測対象外
+            self.ready_logged = True
+            print(f"Cold start to ready: {time.perf_counter() - START_TIME:.2f}s")
         print('------')
 
     async def close(self):
         monitor.running = False
+        await outbound_queue.stop()
+        await symbol_catalog.stop()
+        await exchange_rate_api.stop()
+        await liquidity_monitor.stop()
         await mexc_api.close()
+        await dex_api.close()
         await super().close()
 
 def main():
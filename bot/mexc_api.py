@@ -1,13 +1,22 @@
 import asyncio
+import time
 import aiohttp
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Iterable, Tuple
 
 BASE_URL = "https://api.mexc.com"
 
 class MexcApi:
-    def __init__(self):
+    def __init__(self, base_url: str = BASE_URL, max_concurrency: int = 5, min_interval: float = 0.1):
+        self.base_url = base_url
         self.session: Optional[aiohttp.ClientSession] = None
 
+        # klines取得のレート制限（同時実行数とリクエスト間隔）
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._rate_lock: Optional[asyncio.Lock] = None
+        self._last_request_time = 0.0
+
     async def get_session(self) -> aiohttp.ClientSession:
         if self.session is None or self.session.closed:
             self.session = aiohttp.ClientSession()
@@ -17,13 +26,25 @@ class MexcApi:
         if self.session and not self.session.closed:
             await self.session.close()
 
+    async def _throttle(self):
+        """
+        リクエスト開始間隔が min_interval 以上空くように待機します。
+        """
+        if self._rate_lock is None:
+            self._rate_lock = asyncio.Lock()
+        async with self._rate_lock:
+            wait = self._last_request_time + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request_time = time.monotonic()
+
     async def get_price(self, symbol: str) -> Optional[float]:
         """
         指定されたシンボルの最新価格を取得します。
         symbol形式: '114514USDT' など
         """
         session = await self.get_session()
-        url = f"{BASE_URL}/api/v3/ticker/price"
+        url = f"{self.base_url}/api/v3/ticker/price"
         params = {"symbol": symbol}
         
         try:
@@ -39,6 +60,102 @@ class MexcApi:
             print(f"Exception fetching price for {symbol}: {e}")
             return None
 
+    async def get_klines(self, symbol: str, interval: str = "1m", limit: int = 60) -> List[Tuple[float, float]]:
+        """
+        ローソク足から (確定時刻, 終値) のリストを古い順に返します。
+        未確定の最新足は含みません。
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        session = await self.get_session()
+        url = f"{self.base_url}/api/v3/klines"
+        params = {"symbol": symbol, "interval": interval, "limit": limit}
+
+        async with self._semaphore:
+            await self._throttle()
+            try:
+                async with session.get(url, params=params, timeout=10) as response:
+                    if response.status != 200:
+                        print(f"Error fetching klines for {symbol}: {response.status}")
+                        return []
+                    data = await response.json()
+            except Exception as e:
+                print(f"Exception fetching klines for {symbol}: {e}")
+                return []
+
+        # レスポンス形式: [[openTime, open, high, low, close, volume, closeTime, quoteVolume], ...]
+        now = time.time()
+        samples = []
+        for kline in data:
+            try:
+                close_time = float(kline[6]) / 1000
+                close_price = float(kline[4])
+            except (IndexError, TypeError, ValueError):
+                continue
+            if close_time > now:
+                continue
+            samples.append((close_time, close_price))
+        samples.sort(key=lambda s: s[0])
+        return samples
+
+    async def backfill_history(self, symbols: Iterable[str], minutes: int = 60) -> Dict[str, List[Tuple[float, float]]]:
+        """
+        複数シンボルの直近 minutes 分の1分足を並行して取得します。
+        """
+        symbols = list(symbols)
+        results = await asyncio.gather(
+            *(self.get_klines(symbol, "1m", minutes) for symbol in symbols),
+            return_exceptions=True
+        )
+        history = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"Exception backfilling {symbol}: {result}")
+                continue
+            history[symbol] = result
+        return history
+
+    async def get_exchange_info(self) -> List[Dict]:
+        """
+        取引所の全シンボル情報を一括取得します。失敗時は空リスト。
+        """
+        session = await self.get_session()
+        url = f"{self.base_url}/api/v3/exchangeInfo"
+
+        try:
+            async with session.get(url, timeout=30) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get("symbols", [])
+                print(f"Error fetching exchange info: {response.status}")
+        except Exception as e:
+            print(f"Exception fetching exchange info: {e}")
+        return []
+
+    async def get_all_prices(self) -> Dict[str, float]:
+        """
+        全シンボルの最新価格を1リクエストで取得します。
+        """
+        session = await self.get_session()
+        url = f"{self.base_url}/api/v3/ticker/price"
+
+        try:
+            async with session.get(url, timeout=30) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    prices = {}
+                    for item in data:
+                        try:
+                            prices[item["symbol"]] = float(item["price"])
+                        except (KeyError, TypeError, ValueError):
+                            continue
+                    return prices
+                print(f"Error fetching all prices: {response.status}")
+        except Exception as e:
+            print(f"Exception fetching all prices: {e}")
+        return {}
+
     async def check_symbol_exists(self, symbol: str) -> bool:
         price = await self.get_price(symbol)
         return price is not None
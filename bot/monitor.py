@@ -1,66 +1,264 @@
 import asyncio
+import json
+import os
 import time
 import io
+from bisect import bisect_left
 from collections import deque
-from typing import Dict, Deque, Tuple, Optional, List, Union
+from dataclasses import dataclass
+from typing import Dict, Deque, Tuple, Optional, List, Union, Set, Iterable
 from bot.mexc_api import mexc_api
-from bot.exchange_rate import exchange_rate_api
-from bot.config_store import config_store, ChannelConfig, UserConfig
+from bot.exchange_rate import exchange_rate_api, currency_symbol
+from bot.config_store import config_store, ChannelConfig, UserConfig, ConfigSnapshot
+from bot.rules import rule_engine, RuleMatch
+from bot.alert_state import AlertStateTracker, ALERT_STATE_FILE
+from bot.digest import AlertDigest, DigestItem, Destination, chunk_items, deliver_pending, merge_pending
+from bot.outbound import outbound_queue, PRIORITY_ALERT, PRIORITY_RENAME
+from bot.price_provider import price_provider
+from bot.circuit_breaker import breakers
+from bot.portfolio import portfolio_book, PortfolioValuation
+from bot.volatility import VolatilityTracker, ALERT_MODE_SIGMA
+from bot.extremes import ExtremesTracker
+from bot.pipeline import StageQueue
+from bot.rules import KIND_DRAWDOWN, KIND_BREAKOUT
+
+QUICKCHART_URL = "https://quickchart.io/chart"
+
+# 履歴の取得元のうち、同じ価格系列とみなすもの（klinesによる補完はMEXCの価格）
+PRIMARY_SOURCE = "mexc"
+SOURCE_FAMILIES = {"mexc-kline": PRIMARY_SOURCE}
+
+@dataclass
+class PriceBatch:
+    fetched_at: float # 取得時刻(time.time)。判定はこの時刻を基準に行う
+    prices: Dict[str, float]
+    sources: Dict[str, str]
 
 class PriceMonitor:
-    def __init__(self):
-        # symbol -> deque[(timestamp, price)]
-        self.price_history: Dict[str, Deque[Tuple[float, float]]] = {}
+    def __init__(self, state_path: Optional[str] = ALERT_STATE_FILE):
+        # symbol -> deque[(timestamp, price, source)]
+        self.price_history: Dict[str, Deque[Tuple[float, float, str]]] = {}
+        self.history_seconds = 3600 # 最大60分保持
+
+        # シンボル・時間窓ごとのN分変動率の平均/標準偏差（履歴の追加・削除に合わせて逐次更新）
+        self.volatility = VolatilityTracker(horizon=self.history_seconds)
+        self.default_volatility_window = 5 # 設定がなくても /status 用に集計する時間窓
+        # シンボル・時間窓ごとの高値・安値（単調デックで逐次更新）
+        self.extremes = ExtremesTracker()
+        
+        # klinesで履歴を補完済みのシンボル（非アクティブになったら外して再補完する）
+        self.backfilled_symbols: Set[str] = set()
+
+        # ティックログ（NDJSON）。設定時は取得した価格を追記し、bot.replay で再生できる
+        self.tick_log_path: Optional[str] = os.getenv("TICK_LOG_FILE")
+
+        # 設定スナップショットから導出した索引（設定・ルールのバージョンが変わった時だけ作り直す）
+        self._index_version = (-1, -1)
+        self._config_symbols: Set[str] = set()
+        self._channel_targets: List[Tuple[int, ChannelConfig]] = []
+        self._user_targets: List[Tuple[int, UserConfig]] = []
+        self._portfolio_targets: List[Tuple[int, UserConfig]] = []
+
+        # ルールの水準跨ぎ判定用: (symbol, 取得元の系統) -> その系統での前回の価格
+        self.last_prices: Dict[Tuple[str, str], float] = {}
         
         self.last_check_time = 0
         self.running = False
+        self.interval = 15 # tickの間隔（秒）
+
+        # 取得ステージ全体の期限と、外部呼び出しごとの上限（秒）。遅い取得先が他のシンボルを巻き込まないようにする
+        self.tick_deadline = 10.0
+        self.fetch_budget = 6.0
+        self.backfill_budget = 5.0
+        self.chart_budget = 5.0
+        # 負荷試験などでローカルのスタンドインに向けられるよう差し替え可能にする
+        self.chart_url = os.getenv("QUICKCHART_URL", QUICKCHART_URL)
+        # バックグラウンドで実行中の試し取得（ブレーカーが開いたシンボル）
+        self._probe_tasks: Set[asyncio.Task] = set()
+        
+        # 通知状態 (armed → fired → re-armed)。閾値超えが続く間は再通知しない
+        # キー: "c:<channel_id>:<symbol>:<window>" / "u:<user_id>:<symbol>:<window>" / "r:<rule_id>..."
+        self.alert_state = AlertStateTracker(state_path)
         
-        # 通知クールダウン: channel_id (or user_id) -> last_notification_time
-        # チャンネルごと、ユーザーごとに通知を管理
-        # user_id は正の整数、channel_id も正の整数だが、重複する可能性は低い（Snowflake IDはユニーク）
-        # ただし厳密には分けたほうが安全だが、DiscordのID体系では衝突しない。
-        self.cooldowns: Dict[int, float] = {}
-        self.cooldown_seconds = 60 # 連投防止時間
+        # 通知ダイジェスト: 同一tick（または coalesce_seconds 以内）の通知を宛先ごとに1メッセージへまとめる
+        self.digest = AlertDigest(coalesce_seconds=self._coalesce_seconds_from_env())
+
+        # 取得 → 判定 → 送信 のステージ間キュー
+        # 判定待ちは溢れたら古い価格を捨てる（取得の周期を保つ）。送信待ちは溢れたら判定側が待つ（背圧）
+        self.evaluate_queue: StageQueue[PriceBatch] = StageQueue("evaluate", maxsize=2, drop_oldest=True)
+        self.deliver_queue: StageQueue[Dict[Destination, List[DigestItem]]] = StageQueue("deliver", maxsize=4)
+        self.last_fetch_duration = 0.0
+        self._stage_tasks: List[asyncio.Task] = []
         
         # チャンネル名更新のレート制限管理
         self.last_rename_times: Dict[int, float] = {}
         self.rename_interval = 600 # 10分に1回（Discordの制限対策）
+        self.rename_max_age = 120 # 送信待ちのまま古くなった名前変更は捨てる
 
     async def start(self, bot):
+        """
+        取得 → 判定 → 送信 の3ステージを上限付きキューでつないで動かします。
+        判定・送信が詰まっても取得は interval ごとに続け、判定待ちが溢れたら古い価格から捨てます。
+        送信待ちが溢れた場合は判定側が空くまで待ちます（背圧）。
+        """
         self.running = True
-        print("Starting PriceMonitor...")
-        while self.running:
+        # .env は main.py でこのモジュールの読み込み後に読まれるので、起動時にもう一度反映する
+        self.digest.coalesce_seconds = self._coalesce_seconds_from_env()
+        print(f"Starting PriceMonitor... (alert coalesce {self.digest.coalesce_seconds:g}s)")
+        self._stage_tasks = [
+            asyncio.create_task(self._evaluate_loop(bot)),
+            asyncio.create_task(self._deliver_loop(bot)),
+        ]
+        try:
+            while self.running:
+                started = time.monotonic()
+                try:
+                    batch = await self.fetch_stage()
+                    if batch is not None:
+                        await self.evaluate_queue.put(batch)
+                except Exception as e:
+                    print(f"Error in monitor fetch stage: {e}")
+                self.last_fetch_duration = time.monotonic() - started
+
+                # 15秒ごとに取得（取得に掛かった時間を差し引いて間隔を保つ。判定・送信の時間は含まない）
+                await asyncio.sleep(max(1.0, self.interval - self.last_fetch_duration))
+        finally:
+            for task in self._stage_tasks:
+                task.cancel()
+            await asyncio.gather(*self._stage_tasks, return_exceptions=True)
+            self._stage_tasks = []
+
+    async def _evaluate_loop(self, bot):
+        while True:
+            batch = await self.evaluate_queue.get()
+            started = time.monotonic()
             try:
-                await self.tick(bot)
+                await self.evaluate_stage(bot, batch)
             except Exception as e:
-                print(f"Error in monitor loop: {e}")
-            
-            await asyncio.sleep(15) # 15秒ごとにチェック
+                print(f"Error in monitor evaluate stage: {e}")
+            self.evaluate_queue.done(started)
+
+            pending = self.digest.take()
+            if pending:
+                await self.deliver_queue.put(pending)
+
+    async def _deliver_loop(self, bot):
+        while True:
+            pending = await self.deliver_queue.get()
+            started = time.monotonic()
+            if self.digest.coalesce_seconds > 0:
+                await asyncio.sleep(self.digest.coalesce_seconds)
+            # 送信が遅れて複数回分溜まっていたら、宛先ごとにまとめて1回で送る
+            while True:
+                more = self.deliver_queue.get_nowait()
+                if more is None:
+                    break
+                merge_pending(pending, more)
+            try:
+                await self.deliver_stage(bot, pending)
+            except Exception as e:
+                print(f"Error in monitor deliver stage: {e}")
+            self.deliver_queue.done(started)
 
     async def tick(self, bot):
+        """
+        3ステージを1回ずつ順に実行します（キューを使わない単発実行用）。
+        """
+        batch = await self.fetch_stage()
+        if batch is None:
+            return
+        await self.evaluate_stage(bot, batch)
+        await self.deliver_stage(bot, self.digest.take())
+
+    def pipeline_stats(self) -> Dict[str, object]:
+        return {
+            "interval": self.interval,
+            "fetch_duration": self.last_fetch_duration,
+            "evaluate": self.evaluate_queue.stats(),
+            "deliver": self.deliver_queue.stats(),
+        }
+
+    @staticmethod
+    def _coalesce_seconds_from_env() -> float:
+        """
+        ALERT_COALESCE_SECONDS: 通知をまとめて待つ秒数（既定0 = 判定ごとにすぐ送る）。
+        """
+        value = os.getenv("ALERT_COALESCE_SECONDS", "0")
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            print(f"Invalid ALERT_COALESCE_SECONDS: {value!r}, using 0")
+            return 0.0
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    async def fetch_stage(self) -> Optional[PriceBatch]:
+        """
+        アクティブなシンボルの価格を取得して履歴に加えます。監視対象がなければ None。
+        """
+        deadline = time.monotonic() + self.tick_deadline
+
         # 1. アクティブな設定から必要なシンボルを収集
-        active_symbols = set()
-        for config in config_store.configs.values():
-            if config.monitoring_enabled or config.rename_enabled:
-                active_symbols.add(config.symbol)
-        
-        for u_config in config_store.user_configs.values():
-            if u_config.monitoring_enabled:
-                active_symbols.add(u_config.symbol)
+        # tick中にコマンドで設定が変わっても、このtickは取得した時点のスナップショットで判定する
+        self._refresh_index(config_store.snapshot)
+        active_symbols = self._config_symbols | rule_engine.symbols()
         
+        # 非アクティブになったシンボルは次回アクティブ化時に再補完する
+        self.backfilled_symbols &= active_symbols
+        breakers.prune(lambda name: not name.startswith("price:") or name[len("price:"):] in active_symbols)
+
         if not active_symbols:
-            return
+            return None
 
-        # 2. 価格取得
-        current_prices = {}
+        # 新しく監視対象になったシンボルは過去履歴をklinesで補完
+        new_symbols = active_symbols - self.backfilled_symbols
+        if new_symbols:
+            # 期限内に終わらなければ待たずに進む（補完は裏で完了した時点で履歴に反映される）
+            self.backfilled_symbols |= new_symbols
+            backfill = asyncio.ensure_future(self._backfill(new_symbols))
+            await asyncio.wait({backfill}, timeout=min(self.backfill_budget, self._remaining(deadline)))
+
+        # 2. 価格取得（全シンボル並行。遅い・落ちている取得元はヘッジ/フェイルオーバー）
+        # 失敗続きでブレーカーが開いたシンボルはtickから外し、待機時間後にバックグラウンドで試し取得する
+        symbols = []
         for symbol in active_symbols:
-            price = await mexc_api.get_price(symbol)
-            if price is not None:
-                current_prices[symbol] = price
-                self._add_history(symbol, price)
+            breaker = breakers.get(f"price:{symbol}")
+            if breaker.allow():
+                symbols.append(symbol)
+            elif breaker.probe_due():
+                self._start_probe(symbol)
+
+        budget = min(self.fetch_budget, self._remaining(deadline))
+        samples = await asyncio.gather(*(self._fetch_price(symbol, budget) for symbol in symbols))
+        fetched_at = time.time()
+        current_prices = {}
+        current_sources = {}
+        for symbol, sample in zip(symbols, samples):
+            if sample is not None:
+                current_prices[symbol] = sample.price
+                current_sources[symbol] = sample.source
+                self._add_history(symbol, sample.price, now=fetched_at, source=sample.source)
         
+        if self.tick_log_path and current_prices:
+            self._write_tick_log(current_prices, current_sources)
+
+        return PriceBatch(fetched_at, current_prices, current_sources)
+
+    async def evaluate_stage(self, bot, batch: PriceBatch):
+        """
+        取得済みの価格で通知条件を判定し、通知をダイジェストに積みます（送信はしない）。
+        判定が遅れても、変動率・チャンネル名の差額は取得した時刻を基準に計算します。
+        高値・安値（extremes）とボラティリティ（volatility）は逐次集計の最新状態を参照するため、
+        判定が遅れた場合はそのバッチより新しい取得分を含むことがあります。
+        """
+        current_prices = batch.prices
+        sources = batch.sources
+        now = batch.fetched_at
+
         # 3a. チャンネル設定に基づいて判定
-        for channel_id, config in config_store.configs.items():
+        for channel_id, config in self._channel_targets:
             symbol = config.symbol
             if symbol not in current_prices:
                 continue
@@ -69,54 +267,252 @@ class PriceMonitor:
             
             # チャンネル名の更新
             if config.rename_enabled:
-                await self._update_channel_name(bot, channel_id, config, current_price)
+                await self._update_channel_name(bot, channel_id, config, current_price, now, sources.get(symbol))
 
             if not config.monitoring_enabled:
                 continue
 
-            past_price = self._get_price_n_minutes_ago(symbol, config.window_minutes)
-            if past_price is None:
+            change = self._get_change(symbol, current_price, config.window_minutes, now=now, source=sources.get(symbol))
+            if change is None:
                 continue 
             
-            change_percent = ((current_price - past_price) / past_price) * 100
-            
-            if abs(change_percent) >= config.threshold_percent:
-                await self._notify(bot, channel_id, config, current_price, past_price, change_percent, is_user=False)
-
-        # 3b. ユーザー設定に基づいて判定（DM通知）
-        for user_id, u_config in config_store.user_configs.items():
-            if not u_config.monitoring_enabled:
+            past_price, change_percent = change
+            metric, threshold, zscore = self._alert_metric(config, change_percent)
+            if metric is None:
                 continue
+            state_key = self._state_key("c", channel_id, config)
+            if self.alert_state.update(state_key, metric, threshold, config.rearm_ratio):
+                await self._notify(channel_id, config, current_price, past_price, change_percent, is_user=False, zscore=zscore)
 
+        # 3b. ユーザー設定に基づいて判定（DM通知）
+        for user_id, u_config in self._user_targets:
             symbol = u_config.symbol
             if symbol not in current_prices:
                 continue
 
             current_price = current_prices[symbol]
-            past_price = self._get_price_n_minutes_ago(symbol, u_config.window_minutes)
+            change = self._get_change(symbol, current_price, u_config.window_minutes, now=now, source=sources.get(symbol))
             
-            if past_price is None:
+            if change is None:
                 continue
             
-            change_percent = ((current_price - past_price) / past_price) * 100
-            
-            if abs(change_percent) >= u_config.threshold_percent:
-                await self._notify(bot, user_id, u_config, current_price, past_price, change_percent, is_user=True)
+            past_price, change_percent = change
+            metric, threshold, zscore = self._alert_metric(u_config, change_percent)
+            if metric is None:
+                continue
+            state_key = self._state_key("u", user_id, u_config)
+            if self.alert_state.update(state_key, metric, threshold, u_config.rearm_ratio):
+                await self._notify(user_id, u_config, current_price, past_price, change_percent, is_user=True, zscore=zscore)
 
-    def _add_history(self, symbol: str, price: float):
-        now = time.time()
+        # 3c. ポートフォリオ評価額の更新（価格が変わった銘柄の保有者のみ）と変動通知
+        # 評価額はMEXCの価格だけで計算する（DEXで代替した銘柄は前回のMEXC価格のまま据え置く）
+        portfolio_book.update({
+            symbol: price for symbol, price in current_prices.items()
+            if self._source_family(sources.get(symbol)) == PRIMARY_SOURCE
+        }, now=now)
+        for user_id, u_config in self._portfolio_targets:
+            valuation = portfolio_book.valuation(user_id)
+            if valuation is None or valuation.missing:
+                continue
+            past_total = self._get_past_portfolio_total(user_id, u_config.portfolio_window_minutes, now=now, source=PRIMARY_SOURCE)
+            if not past_total:
+                continue
+            change_percent = (valuation.total - past_total) / past_total * 100
+            state_key = f"p:{user_id}:{u_config.portfolio_window_minutes}"
+            if self.alert_state.update(state_key, change_percent, u_config.portfolio_threshold_percent, u_config.rearm_ratio):
+                await self._notify_portfolio(user_id, u_config, valuation, past_total, change_percent)
+
+        # 3d. アラートルールの判定（価格水準・複数条件）
+        for symbol, current_price in current_prices.items():
+            source = sources.get(symbol)
+            family = self._source_family(source)
+            # 水準跨ぎは同じ系統の取得元どうしでだけ判定する（DEXとMEXCの価格差で跨いだと誤認しないように）
+            prev_price = self.last_prices.get((symbol, family))
+            self.last_prices[(symbol, family)] = current_price
+            # 高値・安値はMEXCの価格だけで集計しているので、他の取得元の価格とは比べない
+            primary = family == PRIMARY_SOURCE
+            matches = rule_engine.evaluate(
+                symbol, prev_price, current_price,
+                lambda window, s=symbol, p=current_price, src=source: self._get_change(s, p, window, now=now, source=src),
+                self.alert_state,
+                lambda window, s=symbol, primary=primary: self.extremes.get(s, window) if primary else None
+            )
+            for match in matches:
+                await self._notify_rule(match, current_price)
+
+        # 削除・変更された設定やルールの状態を破棄して保存
+        self.alert_state.prune(self._is_live_state_key)
+        self.alert_state.save()
+
+    async def deliver_stage(self, bot, pending: Dict[Destination, List[DigestItem]]):
+        """
+        宛先ごとにまとめて送信キューへ積みます（チャート画像は1回の送信内でシンボルごとに1度だけ描画）。
+        チャート描画は chart_budget 以内に限る（間に合わなければ画像なしで送る）。
+        """
+        charts: Dict[str, asyncio.Future] = {}
+        await deliver_pending(
+            pending,
+            lambda target_id, is_user, items: self._deliver_digest(bot, target_id, is_user, items, charts, self.chart_budget)
+        )
+
+    def _get_past_portfolio_total(self, user_id: int, minutes: int, now: Optional[float] = None,
+                                  source: Optional[str] = None) -> Optional[float]:
+        """
+        N分前の価格で評価した合計（USD）。1銘柄でも履歴が足りなければ None。
+        source を指定すると、その系統の取得元の価格だけを使います。
+        """
+        total = 0.0
+        for symbol, amount in portfolio_book.holdings.get(user_id, {}).items():
+            past_price = self._get_price_n_minutes_ago(symbol, minutes, now, source=source)
+            if past_price is None:
+                return None
+            total += amount * past_price
+        return total
+
+    def _refresh_index(self, snapshot: ConfigSnapshot):
+        version = (snapshot.version, rule_engine.version)
+        if version == self._index_version:
+            return
+        self._channel_targets = [
+            (channel_id, config) for channel_id, config in snapshot.configs.items()
+            if config.monitoring_enabled or config.rename_enabled
+        ]
+        self._user_targets = [
+            (user_id, config) for user_id, config in snapshot.user_configs.items()
+            if config.monitoring_enabled
+        ]
+        self._config_symbols = {config.symbol for _, config in self._channel_targets}
+        self._config_symbols |= {config.symbol for _, config in self._user_targets}
+
+        windows: Dict[str, Set[int]] = {}
+        for _, config in self._channel_targets + self._user_targets:
+            windows.setdefault(config.symbol, {self.default_volatility_window}).add(config.window_minutes)
+        self.volatility.set_windows(windows)
+
+        extreme_windows = {symbol: set(ws) for symbol, ws in windows.items()}
+        for symbol, ws in rule_engine.extreme_windows().items():
+            extreme_windows.setdefault(symbol, set()).update(ws)
+        self.extremes.set_windows(extreme_windows)
+
+        # ポートフォリオの銘柄は通知の有無に関係なく毎tick取得する（/portfolio をHTTPなしで返すため）
+        portfolio_book.sync(snapshot.version, snapshot.user_configs)
+        self._config_symbols |= portfolio_book.symbols()
+        self._portfolio_targets = [
+            (user_id, config) for user_id, config in snapshot.user_configs.items()
+            if config.portfolio_threshold_percent > 0 and user_id in portfolio_book.holdings
+        ]
+        self._index_version = version
+
+    async def _fetch_price(self, symbol: str, timeout: float):
+        """
+        期限付きで価格を取得し、結果をシンボルのブレーカーに記録します。
+        """
+        breaker = breakers.get(f"price:{symbol}")
+        try:
+            sample = await asyncio.wait_for(price_provider.get_price(symbol), timeout=timeout) if timeout > 0 else None
+        except asyncio.TimeoutError:
+            sample = None
+            print(f"Price fetch for {symbol} exceeded {timeout:.1f}s budget")
+        if sample is None:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return sample
+
+    def _start_probe(self, symbol: str):
+        task = asyncio.create_task(self._probe(symbol))
+        self._probe_tasks.add(task)
+        task.add_done_callback(self._probe_tasks.discard)
+
+    async def _probe(self, symbol: str):
+        # 成功すれば次のtickから通常の取得に戻る（この値も履歴に加える）
+        sample = await self._fetch_price(symbol, self.fetch_budget)
+        if sample is not None:
+            self._add_history(symbol, sample.price, source=sample.source)
+
+    def _add_history(self, symbol: str, price: float, now: Optional[float] = None, source: str = "mexc"):
+        if now is None:
+            now = time.time()
         if symbol not in self.price_history:
             self.price_history[symbol] = deque()
         
         queue = self.price_history[symbol]
-        queue.append((now, price))
+        queue.append((now, price, source))
         
         # 古い履歴（最大60分保持あれば十分）を削除
-        cutoff = now - 3600
+        cutoff = now - self.history_seconds
         while queue and queue[0][0] < cutoff:
             queue.popleft()
 
-    def _get_price_n_minutes_ago(self, symbol: str, minutes: int) -> Optional[float]:
+        self._observe(symbol, price, now, source)
+
+    @staticmethod
+    def _source_family(source: Optional[str]) -> str:
+        return SOURCE_FAMILIES.get(source, source or PRIMARY_SOURCE)
+
+    def _observe(self, symbol: str, price: float, now: float, source: str = PRIMARY_SOURCE):
+        # ボラティリティ・高値安値とも今回の1件を足して期限切れを引くだけ（履歴は走査しない）
+        for window in self.volatility.windows.get(symbol, ()):
+            change = self._get_change(symbol, price, window, now, source=source)
+            self.volatility.observe(symbol, window, now, change[1] if change else None)
+        # 高値・安値はMEXCの価格だけで集計する（DEXとの価格差を下落・高値更新と誤認しないように）
+        if self._source_family(source) == PRIMARY_SOURCE:
+            self.extremes.observe(symbol, now, price)
+
+    def _rebuild_trackers(self, symbol: str):
+        # 補完で過去の履歴が差し込まれた時だけ、履歴全体から集計し直す
+        self.volatility.reset(symbol)
+        self.extremes.reset(symbol)
+        for ts, price, source in self.price_history.get(symbol, ()):
+            self._observe(symbol, price, ts, source)
+
+    def _write_tick_log(self, prices: Dict[str, float], sources: Dict[str, str]):
+        now = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.tick_log_path) or ".", exist_ok=True)
+            with open(self.tick_log_path, "a", encoding="utf-8") as f:
+                for symbol, price in prices.items():
+                    f.write(json.dumps({"ts": now, "symbol": symbol, "price": price, "source": sources.get(symbol)}) + "\n")
+        except Exception as e:
+            print(f"Error writing tick log: {e}")
+
+    async def _backfill(self, symbols: Iterable[str]):
+        symbols = set(symbols)
+        minutes = self.history_seconds // 60
+        history = await mexc_api.backfill_history(symbols, minutes)
+        for symbol, samples in history.items():
+            self._merge_history(symbol, samples)
+        # 取得に失敗したシンボルも毎tick再試行しないよう補完済み扱いにする
+        self.backfilled_symbols |= symbols
+
+    def _merge_history(self, symbol: str, samples: List[Tuple[float, float]], tolerance: float = 30):
+        """
+        補完用サンプルを時刻順に履歴へマージします。
+        既存サンプルから tolerance 秒以内のものは重複とみなして捨てます（ライブ値を優先）。
+        """
+        queue = self.price_history.get(symbol, deque())
+        existing_times = [entry[0] for entry in queue]
+        merged = list(queue)
+        
+        for ts, price in samples:
+            i = bisect_left(existing_times, ts)
+            if i < len(existing_times) and existing_times[i] - ts < tolerance:
+                continue
+            if i > 0 and ts - existing_times[i - 1] < tolerance:
+                continue
+            merged.append((ts, price, "mexc-kline"))
+        
+        merged.sort(key=lambda s: s[0])
+        cutoff = time.time() - self.history_seconds
+        self.price_history[symbol] = deque(s for s in merged if s[0] >= cutoff)
+        self._rebuild_trackers(symbol)
+
+    def _get_price_n_minutes_ago(self, symbol: str, minutes: int, now: Optional[float] = None,
+                                 source: Optional[str] = None, tolerance: float = 60) -> Optional[float]:
+        """
+        N分前に最も近い履歴の価格（前後 tolerance 秒以内）。
+        source を指定すると同じ取得元の履歴だけを対象にします（取得元間の価格差を変動と誤認しないように）。
+        """
         if symbol not in self.price_history:
             return None
             
@@ -124,73 +520,134 @@ class PriceMonitor:
         if not queue:
             return None
             
-        now = time.time()
+        if now is None:
+            now = time.time()
         target_time = now - (minutes * 60)
         
-        # 最も近い時刻を探す
+        # 最も近い時刻を二分探索で探す（履歴は時刻順）
+        lo, hi = 0, len(queue)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if queue[mid][0] < target_time:
+                lo = mid + 1
+            else:
+                hi = mid
+        
         closest_price = None
         min_diff = float('inf')
+        if source is None:
+            candidates = (lo - 1, lo)
+        else:
+            # 別の取得元の履歴を飛ばしながら前後 tolerance 秒の範囲だけ探す
+            family = self._source_family(source)
+            candidates = []
+            i = lo - 1
+            while i >= 0 and target_time - queue[i][0] <= tolerance:
+                if self._source_family(queue[i][2]) == family:
+                    candidates.append(i)
+                    break
+                i -= 1
+            i = lo
+            while i < len(queue) and queue[i][0] - target_time <= tolerance:
+                if self._source_family(queue[i][2]) == family:
+                    candidates.append(i)
+                    break
+                i += 1
+        for i in candidates:
+            if 0 <= i < len(queue):
+                ts, price = queue[i][0], queue[i][1]
+                diff = abs(ts - target_time)
+                if diff < min_diff:
+                    min_diff = diff
+                    closest_price = price
         
-        for ts, price in queue:
-            diff = abs(ts - target_time)
-            if diff < min_diff:
-                min_diff = diff
-                closest_price = price
-            else:
-                if ts > target_time: 
-                     break
-        
-        if min_diff > 60:
+        if min_diff > tolerance:
             return None
             
         return closest_price
 
-    def get_recent_history(self, symbol: str) -> List[Tuple[float, float]]:
+    def _get_change(self, symbol: str, current_price: float, minutes: int, now: Optional[float] = None,
+                    source: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        """
+        N分前の価格と変動率(%)を返します。履歴不足の場合は None。
+        source は現在価格の取得元で、N分前の価格も同じ取得元の履歴から探します。
+        """
+        past_price = self._get_price_n_minutes_ago(symbol, minutes, now, source)
+        if past_price is None:
+            return None
+        return past_price, ((current_price - past_price) / past_price) * 100
+
+    @staticmethod
+    def _state_key(prefix: str, target_id: int, config: Union[ChannelConfig, UserConfig]) -> str:
+        # シンボルや時間窓、判定方式を変えたら新しい状態（armed）から始まるようにキーに含める
+        key = f"{prefix}:{target_id}:{config.symbol}:{config.window_minutes}"
+        return key + ":s" if config.alert_mode == ALERT_MODE_SIGMA else key
+
+    def _alert_metric(self, config: Union[ChannelConfig, UserConfig], change_percent: float):
+        """
+        通知判定に使う (値, 閾値, zスコア) を返します。
+        σモードでは変動率のzスコアを sigma_k と比較します（集計が足りない間は (None, None, None)）。
+        """
+        if config.alert_mode == ALERT_MODE_SIGMA:
+            zscore = self.volatility.zscore(config.symbol, config.window_minutes, change_percent)
+            if zscore is None:
+                return None, None, None
+            return zscore, config.sigma_k, zscore
+        return change_percent, config.threshold_percent, None
+
+    def _is_live_state_key(self, key: str) -> bool:
+        prefix, _, rest = key.partition(":")
+        if prefix == "r":
+            return rule_engine.owns_state_key(key)
+        try:
+            target_id = int(rest.split(":")[0])
+        except ValueError:
+            return False
+        if prefix == "p":
+            config = config_store.user_configs.get(target_id)
+            return (config is not None and config.portfolio_threshold_percent > 0
+                    and key == f"p:{target_id}:{config.portfolio_window_minutes}")
+        if prefix == "c":
+            config = config_store.configs.get(target_id)
+        elif prefix == "u":
+            config = config_store.user_configs.get(target_id)
+        else:
+            return True
+        return config is not None and config.monitoring_enabled and key == self._state_key(prefix, target_id, config)
+
+    def get_recent_history(self, symbol: str) -> List[Tuple[float, float, str]]:
         if symbol not in self.price_history:
             return []
         history = list(self.price_history[symbol])
         return history[-100:] if len(history) > 100 else history
 
-    async def _notify(self, bot, target_id: int, config: Union[ChannelConfig, UserConfig], current_price: float, past_price: float, change_percent: float, is_user: bool = False):
-        now = time.time()
-        last_notified = self.cooldowns.get(target_id, 0)
+    async def _notify(self, target_id: int, config: Union[ChannelConfig, UserConfig], current_price: float, past_price: float, change_percent: float, is_user: bool = False, zscore: Optional[float] = None):
+        direction_emoji = "🚀 上昇" if change_percent > 0 else "📉 下落"
+        # 個人通知は設定した表示通貨、チャンネル通知は円で表示
+        currency, fx_rate = await exchange_rate_api.get_display_rate(config.currency if is_user else "JPY")
+        fiat = currency_symbol(currency)
+        price_fiat = current_price * fx_rate
+        past_price_fiat = past_price * fx_rate
         
-        if now - last_notified < self.cooldown_seconds:
-            return
-
-        target = None
-        if is_user:
-            try:
-                target = await bot.fetch_user(target_id)
-            except Exception:
-                target = None
+        if zscore is not None:
+            description = f"{config.window_minutes}分前と比較して平常時の変動の{config.sigma_k}σを超えました（{zscore:+.1f}σ）。"
         else:
-            target = bot.get_channel(target_id)
-
-        if not target:
-            return
+            description = f"{config.window_minutes}分前と比較して閾値({config.threshold_percent}%)を超えました。"
 
-        self.cooldowns[target_id] = now
-        
-        direction_emoji = "🚀 上昇" if change_percent > 0 else "📉 下落"
-        usd_jpy = await exchange_rate_api.get_usd_jpy_rate()
-        price_jpy = current_price * usd_jpy
-        past_price_jpy = past_price * usd_jpy
-        
         # メッセージ作成
         embed_dict = {
             "title": f"{config.symbol} {direction_emoji} {abs(change_percent):.2f}%",
-            "description": f"{config.window_minutes}分前と比較して閾値({config.threshold_percent}%)を超えました。",
+            "description": description,
             "color": 0x00ff00 if change_percent > 0 else 0xff0000,
             "fields": [
                 {
                     "name": "現在価格",
-                    "value": f"${current_price:.6f} (約¥{price_jpy:.4f})",
+                    "value": f"${current_price:.6f} (約{fiat}{price_fiat:.4f})",
                     "inline": True
                 },
                 {
                     "name": f"{config.window_minutes}分前",
-                    "value": f"${past_price:.6f} (約¥{past_price_jpy:.4f})",
+                    "value": f"${past_price:.6f} (約{fiat}{past_price_fiat:.4f})",
                     "inline": True
                 },
             ],
@@ -199,16 +656,24 @@ class PriceMonitor:
 
         # 個人通知で保有数が設定されている場合、資産額を表示
         if is_user and hasattr(config, 'holdings') and config.holdings > 0:
-            total_jpy = config.holdings * price_jpy
+            total_fiat = config.holdings * price_fiat
             total_usd = config.holdings * current_price
             
-            past_total_jpy = config.holdings * past_price_jpy
-            diff_jpy = total_jpy - past_total_jpy
-            diff_sign = "+" if diff_jpy >= 0 else ""
+            past_total_fiat = config.holdings * past_price_fiat
+            diff_fiat = total_fiat - past_total_fiat
+            diff_sign = "+" if diff_fiat >= 0 else ""
             
             embed_dict["fields"].append({
                 "name": "💰 保有資産",
-                "value": f"¥{total_jpy:,.0f} (${total_usd:,.2f})\n(前比: {diff_sign}¥{diff_jpy:,.0f})",
+                "value": f"{fiat}{total_fiat:,.0f} (${total_usd:,.2f})\n(前比: {diff_sign}{fiat}{diff_fiat:,.0f})",
+                "inline": False
+            })
+
+        extremes = self.extremes.get(config.symbol, config.window_minutes)
+        if extremes is not None and extremes.high is not None:
+            embed_dict["fields"].append({
+                "name": f"{config.window_minutes}分高値 / 安値",
+                "value": f"${extremes.high:.6f} / ${extremes.low:.6f}\n(高値から -{extremes.drawdown_percent(current_price):.2f}%)",
                 "inline": False
             })
 
@@ -218,63 +683,199 @@ class PriceMonitor:
             "inline": False
         })
         
+        from discord import Embed
+        self.digest.add(target_id, is_user, Embed.from_dict(embed_dict), chart_symbol=config.symbol)
+
+    async def _notify_portfolio(self, user_id: int, config: UserConfig, valuation: PortfolioValuation, past_total: float, change_percent: float):
+        direction_emoji = "🚀 上昇" if change_percent > 0 else "📉 下落"
+        currency, fx_rate = await exchange_rate_api.get_display_rate(config.currency)
+        fiat = currency_symbol(currency)
+        diff_fiat = (valuation.total - past_total) * fx_rate
+        diff_sign = "+" if diff_fiat >= 0 else ""
+
+        lines = [
+            f"{p.symbol}: {p.amount:,.4f} × ${p.price:.6f} = {fiat}{p.value * fx_rate:,.0f}"
+            for p in valuation.positions[:5]
+        ]
+        if len(valuation.positions) > 5:
+            lines.append(f"ほか{len(valuation.positions) - 5}銘柄")
+
+        embed_dict = {
+            "title": f"💼 ポートフォリオ {direction_emoji} {abs(change_percent):.2f}%",
+            "description": f"{config.portfolio_window_minutes}分前と比較して評価額が閾値({config.portfolio_threshold_percent}%)を超えて変動しました。",
+            "color": 0x00ff00 if change_percent > 0 else 0xff0000,
+            "fields": [
+                {
+                    "name": "評価額",
+                    "value": f"{fiat}{valuation.total * fx_rate:,.0f} (${valuation.total:,.2f})\n(前比: {diff_sign}{fiat}{diff_fiat:,.0f})",
+                    "inline": True
+                },
+                {
+                    "name": f"{config.portfolio_window_minutes}分前",
+                    "value": f"{fiat}{past_total * fx_rate:,.0f} (${past_total:,.2f})",
+                    "inline": True
+                },
+                {
+                    "name": "内訳",
+                    "value": "\n".join(lines),
+                    "inline": False
+                },
+            ],
+            "footer": {"text": "MEXC Monitor Bot (DM通知)"}
+        }
+
+        from discord import Embed
+        self.digest.add(user_id, True, Embed.from_dict(embed_dict))
+
+    async def _notify_rule(self, match: RuleMatch, current_price: float):
+        rule = match.rule
+        currency = "JPY"
+        if rule.is_user and rule.target_id in config_store.user_configs:
+            currency = config_store.user_configs[rule.target_id].currency
+        currency, fx_rate = await exchange_rate_api.get_display_rate(currency)
+        fiat = currency_symbol(currency)
+        price_fiat = current_price * fx_rate
+
+        lines = []
+        for cond in match.matched:
+            line = f"・{cond.describe()}"
+            change = match.changes.get(cond.window_minutes) if cond.kind == "change" else None
+            if change:
+                line += f" → {change[1]:+.2f}% (${change[0]:.6f}から)"
+            extremes = match.extremes.get(cond.window_minutes) if cond.kind in (KIND_DRAWDOWN, KIND_BREAKOUT) else None
+            if extremes is not None:
+                if cond.kind == KIND_DRAWDOWN:
+                    line += f" → 高値${extremes.high:.6f}から -{extremes.drawdown_percent(current_price):.2f}%"
+                else:
+                    line += f" → 安値${extremes.low:.6f} / 高値${extremes.high:.6f}"
+            lines.append(line)
+
+        embed_dict = {
+            "title": f"{rule.symbol} 🔔 ルール#{rule.rule_id} 発動",
+            "description": "\n".join(lines),
+            "color": 0xf39c12,
+            "fields": [
+                {
+                    "name": "現在価格",
+                    "value": f"${current_price:.6f} (約{fiat}{price_fiat:.4f})",
+                    "inline": True
+                },
+                {
+                    "name": "条件",
+                    "value": rule.describe(),
+                    "inline": False
+                },
+            ],
+            "footer": {"text": "MEXC Monitor Bot (DM通知)" if rule.is_user else "MEXC Monitor Bot"}
+        }
+
+        from discord import Embed
+        self.digest.add(rule.target_id, rule.is_user, Embed.from_dict(embed_dict), chart_symbol=rule.symbol)
+
+    async def _deliver_digest(self, bot, target_id: int, is_user: bool, items: List[DigestItem], charts: Dict[str, "asyncio.Future"], chart_timeout: float = 10.0):
+        """
+        1宛先分の通知をまとめて送信キューに積みます。Embedは1メッセージ最大10件ずつ、
+        同じシンボルのチャート画像は1メッセージ内で1枚を共有します。
+        """
+        route = f"dm:{target_id}" if is_user else f"POST /channels/{target_id}/messages"
+        for chunk in chunk_items(items):
+            images: List[Tuple[str, bytes]] = []
+            attachments: Dict[str, str] = {}
+            for item in chunk:
+                symbol = item.chart_symbol
+                if symbol is None:
+                    continue
+                if symbol not in charts:
+                    charts[symbol] = asyncio.ensure_future(self._render_chart(symbol, chart_timeout))
+                image = await charts[symbol]
+                if image is None:
+                    continue
+                if symbol not in attachments:
+                    attachments[symbol] = f"chart_{len(attachments)}.png"
+                    images.append((attachments[symbol], image))
+                item.embed.set_image(url=f"attachment://{attachments[symbol]}")
+
+            embeds = [item.embed for item in chunk]
+            outbound_queue.submit(route, self._make_send(bot, target_id, is_user, embeds, images), PRIORITY_ALERT)
+
+    def _make_send(self, bot, target_id: int, is_user: bool, embeds: list, images: List[Tuple[str, bytes]]):
+        async def send():
+            target = await self._resolve_target(bot, target_id, is_user)
+            if not target:
+                return
+            from discord import File
+            # Fileは一度送ると読み終わるので、再送に備えて毎回作り直す
+            files = [File(io.BytesIO(data), filename=name) for name, data in images]
+            await target.send(embeds=embeds, files=files)
+        return send
+
+    async def _resolve_target(self, bot, target_id: int, is_user: bool):
+        if is_user:
+            try:
+                return await bot.fetch_user(target_id)
+            except Exception:
+                return None
+        return bot.get_channel(target_id)
+
+    async def _render_chart(self, symbol: str, timeout: float = 10.0) -> Optional[bytes]:
+        """
+        QuickChartで直近の価格推移チャートを描画し、PNG画像を返します。
+        履歴不足や描画失敗時、QuickChartのブレーカーが開いている間は None。
+        """
+        history = self.get_recent_history(symbol)
+        if len(history) <= 2 or timeout <= 0:
+            return None
+
+        breaker = breakers.get("quickchart")
+        if not breaker.allow() and not breaker.probe_due():
+            return None
+
         try:
-            from discord import Embed, File
-            discord_embed = Embed.from_dict(embed_dict)
-            file = None
+            step = max(1, len(history) // 50)
+            chart_data = history[::step]
+            prices = [h[1] for h in chart_data]
+            labels = ["" for _ in chart_data]
             
-            # QuickChart (共通ロジック)
-            history = self.get_recent_history(config.symbol)
-            if len(history) > 2:
-                try:
-                    step = max(1, len(history) // 50)
-                    chart_data = history[::step]
-                    prices = [h[1] for h in chart_data]
-                    labels = ["" for _ in chart_data]
-                    
-                    qc_config = {
-                        "type": "line",
-                        "data": {
-                            "labels": labels,
-                            "datasets": [{
-                                "label": config.symbol,
-                                "data": prices,
-                                "borderColor": "rgb(75, 192, 192)",
-                                "borderWidth": 2,
-                                "pointRadius": 0,
-                                "fill": False
-                            }]
-                        },
-                        "options": {
-                            "legend": {"display": False},
-                            "scales": {
-                                "xAxes": [{"display": False}],
-                                "yAxes": [{"display": True}]
-                            }
-                        }
+            qc_config = {
+                "type": "line",
+                "data": {
+                    "labels": labels,
+                    "datasets": [{
+                        "label": symbol,
+                        "data": prices,
+                        "borderColor": "rgb(75, 192, 192)",
+                        "borderWidth": 2,
+                        "pointRadius": 0,
+                        "fill": False
+                    }]
+                },
+                "options": {
+                    "legend": {"display": False},
+                    "scales": {
+                        "xAxes": [{"display": False}],
+                        "yAxes": [{"display": True}]
                     }
-                    
-                    # URL生成ではなくPOSTで画像を取得する (URL長制限回避)
-                    session = await mexc_api.get_session()
-                    async with session.post("https://quickchart.io/chart", json={"chart": qc_config, "width": 500, "height": 300, "backgroundColor": "white"}) as resp:
-                        if resp.status == 200:
-                            image_data = await resp.read()
-                            file = File(io.BytesIO(image_data), filename="chart.png")
-                            discord_embed.set_image(url="attachment://chart.png")
-                        else:
-                            print(f"QuickChart error: {resp.status}")
-                            
-                except Exception as e:
-                    print(f"Chart error: {e}")
-
-            if file:
-                await target.send(embed=discord_embed, file=file)
-            else:
-                await target.send(embed=discord_embed)
+                }
+            }
+            
+            # URL生成ではなくPOSTで画像を取得する (URL長制限回避)
+            session = await mexc_api.get_session()
+            async with session.post(self.chart_url, json={"chart": qc_config, "width": 500, "height": 300, "backgroundColor": "white"}, timeout=timeout) as resp:
+                if resp.status == 200:
+                    image = await resp.read()
+                    breaker.record_success()
+                    return image
+                print(f"QuickChart error: {resp.status}")
         except Exception as e:
-            print(f"Error sending notification to {target_id}: {e}")
+            print(f"Chart error: {e!r}")
+        breaker.record_failure()
+        return None
 
-    async def _update_channel_name(self, bot, channel_id: int, config: ChannelConfig, price: float):
+    async def _update_channel_name(self, bot, channel_id: int, config: ChannelConfig, price: float,
+                                   fetched_at: Optional[float] = None, source: Optional[str] = None):
+        """
+        fetched_at は price を取得した時刻。判定が遅れても、その時点のN分前と比べた差を表示する。
+        """
         now = time.time()
         last_rename = self.last_rename_times.get(channel_id, 0)
         
@@ -290,7 +891,7 @@ class PriceMonitor:
             price_jpy = price * usd_jpy
             
             # 設定された期間（window_minutes）の価格変動を表示
-            past_price = self._get_price_n_minutes_ago(config.symbol, config.window_minutes)
+            past_price = self._get_price_n_minutes_ago(config.symbol, config.window_minutes, fetched_at, source)
             
             suffix = ""
             if past_price is not None:
@@ -309,7 +910,14 @@ class PriceMonitor:
             new_name = f"{base_name} {suffix}"
             
             if original_name != new_name:
-                await channel.edit(name=new_name)
+                # 通知より低優先で送信。古い価格の名前は無価値なので、新しい更新で置き換え、一定時間で破棄する
+                outbound_queue.submit(
+                    f"PATCH /channels/{channel_id}",
+                    lambda: channel.edit(name=new_name),
+                    PRIORITY_RENAME,
+                    max_age=self.rename_max_age,
+                    replace_key=f"rename:{channel_id}"
+                )
                 self.last_rename_times[channel_id] = now
                 
         except Exception as e:
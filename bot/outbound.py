@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+# 数値が小さいほど優先（通知は常にチャンネル名変更より先に送る）
+PRIORITY_ALERT = 0
+PRIORITY_RENAME = 10
+PRIORITY_NAMES = {PRIORITY_ALERT: "alert", PRIORITY_RENAME: "rename"}
+
+@dataclass
+class OutboundJob:
+    route: str # レート制限バケットの単位（例: "POST /channels/123/messages"）
+    factory: Callable[[], Awaitable[None]]
+    priority: int
+    seq: int
+    created_at: float
+    max_age: Optional[float] = None # これより古くなったら送らずに捨てる
+    replace_key: Optional[str] = None # 同じキーの新しいジョブが来たら古い方を捨てる
+    attempts: int = 0
+    cancelled: bool = False
+
+class OutboundQueue:
+    """
+    Discordへの書き込み（通知送信・チャンネル名変更）を一本化する優先度付きキュー。
+
+    - 優先度の高いジョブから実行し、同じルートのジョブは同時に1つだけ実行します。
+    - 429 (discord.RateLimited) を受けたルートは retry_after の間ブロックし、ジョブを後回しにします。
+    - max_age を過ぎたジョブや replace_key で置き換えられたジョブは送らずに捨てます。
+    """
+    def __init__(self, workers: int = 2, max_attempts: int = 3):
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+
+        self._jobs: List[OutboundJob] = []
+        self._replaceable: Dict[str, OutboundJob] = {}
+        self._seq = 0
+
+        # ルートごとのレート制限: route -> 再開可能時刻(monotonic)
+        self.blocked_until: Dict[str, float] = {}
+        self._busy_routes: Set[str] = set()
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+        # メトリクス
+        self.counters: Dict[str, int] = {
+            "sent": 0, "failed": 0, "rate_limited": 0, "dropped_stale": 0, "superseded": 0
+        }
+        self.wait_times: Dict[int, Deque[float]] = {}
+
+    def start(self):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, route: str, factory: Callable[[], Awaitable[None]], priority: int = PRIORITY_ALERT,
+               max_age: Optional[float] = None, replace_key: Optional[str] = None) -> OutboundJob:
+        self._seq += 1
+        job = OutboundJob(
+            route=route,
+            factory=factory,
+            priority=priority,
+            seq=self._seq,
+            created_at=time.monotonic(),
+            max_age=max_age,
+            replace_key=replace_key
+        )
+        if replace_key:
+            old = self._replaceable.get(replace_key)
+            if old is not None and not old.cancelled:
+                old.cancelled = True
+                self.counters["superseded"] += 1
+            self._replaceable[replace_key] = job
+
+        self._jobs.append(job)
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    def _pick(self, now: float):
+        """
+        実行可能なジョブのうち最も優先度の高いものを取り出します。
+        戻り値: (ジョブ, 次に実行可能になるまでの秒数)
+        """
+        best = None
+        next_ready = None
+        alive = []
+        for job in self._jobs:
+            if job.cancelled:
+                continue
+            if job.max_age is not None and now - job.created_at > job.max_age:
+                self.counters["dropped_stale"] += 1
+                self._forget(job)
+                continue
+            alive.append(job)
+
+            if job.route in self._busy_routes:
+                continue
+            blocked = self.blocked_until.get(job.route, 0)
+            if blocked > now:
+                wait = blocked - now
+                next_ready = wait if next_ready is None else min(next_ready, wait)
+                continue
+            if best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                best = job
+
+        if best is not None:
+            alive.remove(best)
+        self._jobs = alive
+        return best, next_ready
+
+    def _forget(self, job: OutboundJob):
+        if job.replace_key and self._replaceable.get(job.replace_key) is job:
+            del self._replaceable[job.replace_key]
+
+    async def _worker(self):
+        while True:
+            job, next_ready = self._pick(time.monotonic())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_ready)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._busy_routes.add(job.route)
+            try:
+                await self._run(job)
+            finally:
+                self._busy_routes.discard(job.route)
+                # 同じルートの後続ジョブを待っている他のワーカーを起こす
+                self._wakeup.set()
+
+    async def _run(self, job: OutboundJob):
+        import discord
+
+        started = time.monotonic()
+        job.attempts += 1
+        try:
+            await job.factory()
+            self.counters["sent"] += 1
+            self.wait_times.setdefault(job.priority, deque(maxlen=500)).append(started - job.created_at)
+            self._forget(job)
+        except discord.RateLimited as e:
+            self._defer(job, e.retry_after)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                retry_after = float(e.response.headers.get("Retry-After", 5)) if e.response is not None else 5.0
+                self._defer(job, retry_after)
+            else:
+                self.counters["failed"] += 1
+                self._forget(job)
+                print(f"Outbound error on {job.route}: {e}")
+        except Exception as e:
+            self.counters["failed"] += 1
+            self._forget(job)
+            print(f"Outbound error on {job.route}: {e}")
+
+    def _defer(self, job: OutboundJob, retry_after: float):
+        self.counters["rate_limited"] += 1
+        self.blocked_until[job.route] = time.monotonic() + retry_after
+        if job.attempts >= self.max_attempts or job.cancelled:
+            self.counters["failed"] += 1
+            self._forget(job)
+            return
+        # 再開時刻が max_age を超える場合は次の _pick で破棄される
+        self._jobs.append(job)
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        depth: Dict[str, int] = {}
+        oldest: Dict[str, float] = {}
+        for job in self._jobs:
+            if job.cancelled:
+                continue
+            name = PRIORITY_NAMES.get(job.priority, str(job.priority))
+            depth[name] = depth.get(name, 0) + 1
+            oldest[name] = max(oldest.get(name, 0.0), now - job.created_at)
+
+        waits = {}
+        for priority, samples in self.wait_times.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            waits[PRIORITY_NAMES.get(priority, str(priority))] = {
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+            }
+
+        return {
+            "depth": depth,
+            "oldest": oldest,
+            "wait": waits,
+            "blocked_routes": sum(1 for t in self.blocked_until.values() if t > now),
+            **self.counters,
+        }
+
+outbound_queue = OutboundQueue()
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class StageQueue(Generic[T]):
+    """
+    監視のステージ間（取得 → 判定 → 送信）をつなぐ上限付きキュー。
+
+    - drop_oldest=False: 満杯なら put() は空きが出るまで待つ（前段に背圧をかける）
+    - drop_oldest=True: 満杯なら最も古い要素を捨てて入れる（前段は待たずに周期を保てる）
+
+    各要素が入ってから取り出されるまでの待ち時間（遅延）と、処理にかかった時間を記録します。
+    """
+    def __init__(self, name: str, maxsize: int, drop_oldest: bool = False, samples: int = 100):
+        self.name = name
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+
+        # (投入時刻(monotonic), 要素)
+        self._items: Deque[Tuple[float, T]] = deque()
+        # Event はループ上で初めて使う時に作る（Python 3.9 では生成時のループに紐づくため、
+        # モジュール読み込み時に作ると bot.run() のループで待てない）
+        self._not_empty: Optional[asyncio.Event] = None
+        self._not_full: Optional[asyncio.Event] = None
+
+        self.waits: Deque[float] = deque(maxlen=samples)
+        self.last_duration = 0.0 # 直近の1件の処理時間（秒）
+        self.processed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _ensure_events(self):
+        if self._not_empty is None:
+            self._not_empty = asyncio.Event()
+            self._not_full = asyncio.Event()
+            if len(self._items) < self.maxsize:
+                self._not_full.set()
+
+    async def put(self, item: T):
+        self._ensure_events()
+        while len(self._items) >= self.maxsize:
+            if self.drop_oldest:
+                self._items.popleft()
+                self.dropped += 1
+                break
+            self._not_full.clear()
+            await self._not_full.wait()
+        self._items.append((time.monotonic(), item))
+        self._not_empty.set()
+
+    async def get(self) -> T:
+        self._ensure_events()
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        enqueued, item = self._items.popleft()
+        self.waits.append(time.monotonic() - enqueued)
+        self._not_full.set()
+        return item
+
+    def get_nowait(self) -> Optional[T]:
+        """
+        すぐに取り出せる要素があれば返します（溜まっている分をまとめて処理する用）。
+        """
+        if not self._items:
+            return None
+        enqueued, item = self._items.popleft()
+        self.waits.append(time.monotonic() - enqueued)
+        if self._not_full is not None:
+            self._not_full.set()
+        return item
+
+    def done(self, started: float):
+        """
+        1件の処理が終わったら、取り出した時刻(monotonic)を渡して呼びます。
+        """
+        self.last_duration = time.monotonic() - started
+        self.processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        ordered = sorted(self.waits)
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "oldest": now - self._items[0][0] if self._items else 0.0,
+            "wait_p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0,
+            "wait_max": ordered[-1] if ordered else 0.0,
+            "last_duration": self.last_duration,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
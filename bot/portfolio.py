@@ -0,0 +1,110 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Set
+from bot.config_store import UserConfig
+
+MAX_PORTFOLIO_SYMBOLS = 20
+
+@dataclass
+class Position:
+    symbol: str
+    amount: float
+    price: Optional[float] # 未取得なら None
+    value: float # USD
+
+@dataclass
+class PortfolioValuation:
+    user_id: int
+    positions: List[Position]
+    total: float # USD（価格取得済みの銘柄のみ）
+    missing: List[str] = field(default_factory=list) # 価格未取得の銘柄
+    updated_at: float = 0.0
+
+class PortfolioBook:
+    """
+    全ユーザーのポートフォリオ評価額を保持し、tickで取得済みの価格から差分だけ更新します。
+
+    - 銘柄 -> 保有ユーザーの逆引き索引を持ち、価格が変わった銘柄の保有者だけ再計算します。
+    - 設定のバージョンが変わった時だけ保有内容を読み直します（その際は全額を再計算）。
+    - /portfolio はここに溜まった値を返すだけなので、HTTPリクエストは発生しません。
+    """
+    def __init__(self):
+        self.version = -1
+        # user_id -> {symbol: 枚数}
+        self.holdings: Dict[int, Dict[str, float]] = {}
+        # symbol -> 保有している user_id
+        self.holders: Dict[str, Set[int]] = {}
+        # symbol -> 評価に使った最新価格
+        self.prices: Dict[str, float] = {}
+        # user_id -> 評価額（USD）
+        self.totals: Dict[int, float] = {}
+        self.updated_at: Dict[int, float] = {}
+
+    def symbols(self) -> Set[str]:
+        return set(self.holders)
+
+    def sync(self, version: int, user_configs: Mapping[int, UserConfig]):
+        if version == self.version:
+            return
+        self.holdings = {}
+        self.holders = {}
+        for user_id, config in user_configs.items():
+            positions = {s: a for s, a in config.positions().items() if a > 0}
+            if not positions:
+                continue
+            self.holdings[user_id] = positions
+            for symbol in positions:
+                self.holders.setdefault(symbol, set()).add(user_id)
+
+        # 保有内容が変わったので合計は作り直す（差分更新の誤差もここでリセットされる）
+        self.totals = {user_id: self._full_total(positions) for user_id, positions in self.holdings.items()}
+        self.updated_at = {user_id: self.updated_at.get(user_id, 0.0) for user_id in self.holdings}
+        self.prices = {s: p for s, p in self.prices.items() if s in self.holders}
+        self.version = version
+
+    def _full_total(self, positions: Dict[str, float]) -> float:
+        return sum(amount * self.prices[symbol] for symbol, amount in positions.items() if symbol in self.prices)
+
+    def update(self, prices: Mapping[str, float], now: Optional[float] = None) -> Set[int]:
+        """
+        今回のtickの価格で評価額を更新し、評価額が変わったユーザーを返します。
+        """
+        if now is None:
+            now = time.time()
+        changed: Set[int] = set()
+        for symbol, price in prices.items():
+            users = self.holders.get(symbol)
+            if not users:
+                continue
+            previous = self.prices.get(symbol, 0.0)
+            if price == previous:
+                continue
+            self.prices[symbol] = price
+            delta = price - previous
+            for user_id in users:
+                self.totals[user_id] += self.holdings[user_id][symbol] * delta
+                self.updated_at[user_id] = now
+                changed.add(user_id)
+        return changed
+
+    def valuation(self, user_id: int) -> Optional[PortfolioValuation]:
+        positions = self.holdings.get(user_id)
+        if positions is None:
+            return None
+        rows = []
+        missing = []
+        for symbol, amount in sorted(positions.items()):
+            price = self.prices.get(symbol)
+            if price is None:
+                missing.append(symbol)
+            rows.append(Position(symbol, amount, price, amount * price if price is not None else 0.0))
+        rows.sort(key=lambda p: p.value, reverse=True)
+        return PortfolioValuation(
+            user_id=user_id,
+            positions=rows,
+            total=self.totals.get(user_id, 0.0),
+            missing=missing,
+            updated_at=self.updated_at.get(user_id, 0.0)
+        )
+
+portfolio_book = PortfolioBook()
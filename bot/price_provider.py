@@ -0,0 +1,199 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+from bot.mexc_api import mexc_api
+from bot.dex_api import dex_api
+
+# DexScreenerの priceUsd と比較できるクォート通貨
+USD_QUOTES = ("USDT", "USDC")
+
+@dataclass
+class PriceSample:
+    price: float
+    source: str # 取得元（"mexc" / "dexscreener"）
+    latency: float
+
+class PriceSource(ABC):
+    """
+    価格取得元の基底クラス。直近のレイテンシを記録してp95を返します。
+    """
+    name = "unknown"
+
+    def __init__(self, window: int = 200):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+
+    @abstractmethod
+    async def fetch(self, symbol: str) -> Optional[float]:
+        """
+        価格（USD建て）を返します。取得できなければ None。
+        """
+
+    def supports(self, symbol: str) -> bool:
+        return True
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def timed_fetch(self, symbol: str) -> Optional[PriceSample]:
+        started = time.monotonic()
+        try:
+            price = await self.fetch(symbol)
+        except asyncio.CancelledError:
+            # ヘッジで打ち切られた場合も、少なくともここまで掛かったことを記録する
+            self.latencies.append(time.monotonic() - started)
+            raise
+        except Exception as e:
+            print(f"Exception fetching price from {self.name} for {symbol}: {e}")
+            price = None
+
+        latency = time.monotonic() - started
+        self.latencies.append(latency)
+        if price is None:
+            self.failures += 1
+            return None
+        self.successes += 1
+        return PriceSample(price=price, source=self.name, latency=latency)
+
+class MexcPriceSource(PriceSource):
+    name = "mexc"
+
+    async def fetch(self, symbol: str) -> Optional[float]:
+        return await mexc_api.get_price(symbol)
+
+class DexPriceSource(PriceSource):
+    """
+    DexScreenerの最も流動性の高いペアの priceUsd を使います。USDT/USDC建てのシンボルのみ対応。
+    ペアは初回に検索して記憶し、以降はペア指定で取得します。
+    見つからなかったシンボルは一定時間だけ対象外にします（検索の失敗は短め、別トークンしかない場合は長め）。
+    """
+    name = "dexscreener"
+
+    def __init__(self, window: int = 200, retry_after_error: float = 60, retry_after_mismatch: float = 1800):
+        super().__init__(window)
+        self.retry_after_error = retry_after_error
+        self.retry_after_mismatch = retry_after_mismatch
+        # symbol -> (chainId, pairAddress)
+        self.pairs: Dict[str, Tuple[str, str]] = {}
+        # symbol -> 再検索してよい時刻(monotonic)
+        self.misses: Dict[str, float] = {}
+
+    @staticmethod
+    def base_asset(symbol: str) -> Optional[str]:
+        for quote in USD_QUOTES:
+            if symbol.upper().endswith(quote) and len(symbol) > len(quote):
+                return symbol[:-len(quote)].upper()
+        return None
+
+    def supports(self, symbol: str) -> bool:
+        # 未解決のシンボルは試してみる。検索で見つからなかったものは再検索できるまで対象外
+        return self.base_asset(symbol) is not None and self.misses.get(symbol, 0.0) <= time.monotonic()
+
+    async def _resolve(self, symbol: str) -> Optional[Tuple[str, str]]:
+        if symbol in self.pairs:
+            return self.pairs[symbol]
+        if self.misses.get(symbol, 0.0) > time.monotonic():
+            return None
+
+        base = self.base_asset(symbol)
+        if not base:
+            return None
+        stats = await dex_api.get_token_stats(base)
+        if not stats:
+            # レート制限・通信エラーでも None になるので、短い間隔で再検索する
+            self.misses[symbol] = time.monotonic() + self.retry_after_error
+            return None
+        # 検索結果が別トークンのこともあるので、シンボルが一致する場合のみ採用
+        if str(stats.get("baseToken", {}).get("symbol", "")).upper() != base:
+            self.misses[symbol] = time.monotonic() + self.retry_after_mismatch
+            return None
+        pair = (stats["chainId"], stats["pairAddress"])
+        self.pairs[symbol] = pair
+        self.misses.pop(symbol, None)
+        return pair
+
+    async def fetch(self, symbol: str) -> Optional[float]:
+        pair = await self._resolve(symbol)
+        if pair is None:
+            return None
+        data = await dex_api.get_pair(*pair)
+        if not data or not data.get("priceUsd"):
+            return None
+        return float(data["priceUsd"])
+
+class HedgedPriceProvider:
+    """
+    プライマリ（MEXC）から価格を取得し、p95 より遅ければセカンダリ（DexScreener）にも
+    ヘッジリクエストを出して先に返った方を採用します。プライマリが失敗した場合はセカンダリへフェイルオーバーします。
+    """
+    def __init__(self, primary: PriceSource, secondary: PriceSource,
+                 min_hedge_delay: float = 0.5, max_hedge_delay: float = 5.0):
+        self.primary = primary
+        self.secondary = secondary
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+
+        self.counters: Dict[str, int] = {"hedged": 0, "hedge_won": 0, "failover": 0}
+
+    def hedge_delay(self) -> float:
+        p95 = self.primary.p95()
+        if p95 is None:
+            return self.max_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, p95))
+
+    async def get_price(self, symbol: str) -> Optional[PriceSample]:
+        if not self.secondary.supports(symbol):
+            return await self.primary.timed_fetch(symbol)
+
+        primary_task = asyncio.create_task(self.primary.timed_fetch(symbol))
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_delay())
+        except asyncio.CancelledError:
+            # 呼び出し元の期限切れ（wait_for）でキャンセルされた場合は取得も止める
+            primary_task.cancel()
+            raise
+
+        if primary_task in done:
+            sample = primary_task.result()
+            if sample is not None:
+                return sample
+            self.counters["failover"] += 1
+            return await self.secondary.timed_fetch(symbol)
+
+        # プライマリが遅いのでセカンダリにも投げ、先に成功した方を使う
+        self.counters["hedged"] += 1
+        secondary_task = asyncio.create_task(self.secondary.timed_fetch(symbol))
+        pending = {primary_task, secondary_task}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sample = task.result()
+                    if sample is not None:
+                        if task is secondary_task:
+                            self.counters["hedge_won"] += 1
+                        return sample
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, object]:
+        sources = {}
+        for source in (self.primary, self.secondary):
+            p95 = source.p95()
+            sources[source.name] = {
+                "ok": source.successes,
+                "failed": source.failures,
+                "p95": p95,
+            }
+        return {"sources": sources, **self.counters}
+
+price_provider = HedgedPriceProvider(MexcPriceSource(), DexPriceSource())
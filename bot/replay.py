@@ -0,0 +1,169 @@
+"""
+記録済みのティック（CSV または TICK_LOG_FILE のNDJSONログ）を高速に再生し、
+閾値・時間窓の組み合わせごとに何回・いつ通知が発生したかを集計します。
+
+判定は PriceMonitor と同じ履歴管理・変動率計算・通知状態（エッジトリガー）を使い、
+シミュレーション時刻はティックのタイムスタンプで進めます（待機なし）。
+ファイルは1行ずつ読むため、ティック数に関係なくメモリ使用量は一定です。
+
+使い方:
+    python -m bot.replay ticks.csv --windows 5,10,30 --thresholds 1,2,3
+    python -m bot.replay data/ticks.ndjson --symbol 114514USDT --events
+"""
+import argparse
+import csv
+import gzip
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from bot.monitor import PriceMonitor
+from bot.alert_state import DEFAULT_REARM_RATIO
+
+DEFAULT_SYMBOL = "114514USDT"
+
+# (timestamp, symbol, price)
+Tick = Tuple[float, str, float]
+
+@dataclass
+class ReplayResult:
+    symbol: str
+    window_minutes: int
+    threshold_percent: float
+    alerts: int = 0
+    first_alert: Optional[float] = None
+    last_alert: Optional[float] = None
+    max_change_percent: float = 0.0
+    state_key: str = ""
+
+def _parse_timestamp(value: str) -> float:
+    try:
+        ts = float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    # ミリ秒表記の場合は秒に変換
+    return ts / 1000 if ts > 1e11 else ts
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def iter_ticks(path: str, default_symbol: str = DEFAULT_SYMBOL) -> Iterator[Tick]:
+    """
+    ティックファイルを1行ずつ読み、(timestamp, symbol, price) を返します。
+    CSV: timestamp,symbol,price または timestamp,price（ヘッダー行は任意）
+    NDJSON: {"ts": ..., "symbol": ..., "price": ...}
+    """
+    base = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as f:
+        if base.endswith((".ndjson", ".jsonl", ".log", ".json")):
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                    yield _parse_timestamp(str(row["ts"])), row.get("symbol", default_symbol), float(row["price"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        else:
+            for row in csv.reader(f):
+                try:
+                    if len(row) >= 3:
+                        yield _parse_timestamp(row[0]), row[1], float(row[2])
+                    elif len(row) == 2:
+                        yield _parse_timestamp(row[0]), default_symbol, float(row[1])
+                except ValueError:
+                    # ヘッダー行など
+                    continue
+
+def replay(ticks: Iterable[Tick],
+           windows: List[int],
+           thresholds: List[float],
+           symbols: Optional[Iterable[str]] = None,
+           rearm_ratio: float = DEFAULT_REARM_RATIO,
+           on_alert: Optional[Callable[[ReplayResult, float, float, float], None]] = None) -> Dict[Tuple[str, int, float], ReplayResult]:
+    """
+    ティック列を1パスで再生し、全ての (symbol, window, threshold) の組み合わせを同時に評価します。
+    N分前価格の探索は時間窓ごとに1回だけ行い、閾値間で共有します。
+    """
+    sim = PriceMonitor(state_path=None)
+    sim.tick_log_path = None
+    symbol_filter = set(symbols) if symbols else None
+    windows = sorted(set(windows))
+    thresholds = sorted(set(thresholds))
+    results: Dict[Tuple[str, int, float], ReplayResult] = {}
+
+    for ts, symbol, price in ticks:
+        if symbol_filter is not None and symbol not in symbol_filter:
+            continue
+
+        sim._add_history(symbol, price, now=ts)
+
+        for window in windows:
+            change = sim._get_change(symbol, price, window, now=ts)
+            if change is None:
+                continue
+            _, change_percent = change
+
+            for threshold in thresholds:
+                key = (symbol, window, threshold)
+                result = results.get(key)
+                if result is None:
+                    result = results[key] = ReplayResult(symbol, window, threshold, state_key=f"{symbol}:{window}:{threshold}")
+                if abs(change_percent) > abs(result.max_change_percent):
+                    result.max_change_percent = change_percent
+
+                if not sim.alert_state.update(result.state_key, change_percent, threshold, rearm_ratio):
+                    continue
+
+                result.alerts += 1
+                if result.first_alert is None:
+                    result.first_alert = ts
+                result.last_alert = ts
+                if on_alert:
+                    on_alert(result, ts, price, change_percent)
+
+    return results
+
+def _format_ts(ts: Optional[float]) -> str:
+    if ts is None:
+        return "-"
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+def _parse_list(value: str, cast):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="記録済みティックで通知閾値をバックテストします")
+    parser.add_argument("path", help="ティックファイル (.csv / .ndjson、.gz圧縮可)")
+    parser.add_argument("--windows", default="5", help="時間窓（分）のカンマ区切り 例: 5,10,30")
+    parser.add_argument("--thresholds", default="2.0", help="閾値（%%）のカンマ区切り 例: 1,2,3")
+    parser.add_argument("--symbol", action="append", help="対象シンボル（複数指定可、省略時は全て）")
+    parser.add_argument("--default-symbol", default=DEFAULT_SYMBOL, help="シンボル列がないCSVのシンボル")
+    parser.add_argument("--rearm-ratio", type=float, default=DEFAULT_REARM_RATIO, help="再通知可能になる変動率（閾値に対する割合）")
+    parser.add_argument("--events", action="store_true", help="通知が発生するたびに出力する")
+    args = parser.parse_args()
+
+    def print_event(result: ReplayResult, ts: float, price: float, change_percent: float):
+        print(f"{_format_ts(ts)} {result.symbol} {result.window_minutes}分 ±{result.threshold_percent}% "
+              f"-> {change_percent:+.2f}% (${price:.6f})")
+
+    results = replay(
+        iter_ticks(args.path, args.default_symbol),
+        _parse_list(args.windows, int),
+        _parse_list(args.thresholds, float),
+        symbols=args.symbol,
+        rearm_ratio=args.rearm_ratio,
+        on_alert=print_event if args.events else None
+    )
+
+    print(f"{'symbol':<14}{'window':>8}{'threshold':>11}{'alerts':>8}{'max_change':>12}  first / last")
+    for key in sorted(results):
+        r = results[key]
+        print(f"{r.symbol:<14}{r.window_minutes:>7}m{r.threshold_percent:>10.2f}%{r.alerts:>8}"
+              f"{r.max_change_percent:>+11.2f}%  {_format_ts(r.first_alert)} / {_format_ts(r.last_alert)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import json
+import os
+import re
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, asdict, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from bot.alert_state import AlertStateTracker, DEFAULT_REARM_RATIO
+from bot.extremes import WindowExtremes
+
+RULES_FILE = "data/rules.json"
+MAX_RULES_PER_TARGET = 50
+
+# 条件の種類
+KIND_CHANGE = "change" # N分間の変動率が閾値以上
+KIND_ABOVE = "above"   # 価格が指定値を上抜け
+KIND_BELOW = "below"   # 価格が指定値を下抜け
+KIND_DRAWDOWN = "drawdown" # N分間の高値から X% 以上下落
+KIND_BREAKOUT = "breakout" # N分間の高値を更新
+LEVEL_KINDS = (KIND_ABOVE, KIND_BELOW)
+# 毎tick評価が必要な（時間窓を使う）条件
+WINDOW_KINDS = (KIND_CHANGE, KIND_DRAWDOWN, KIND_BREAKOUT)
+
+MODE_ANY = "any" # OR
+MODE_ALL = "all" # AND
+
+@dataclass
+class RuleCondition:
+    kind: str
+    value: float # change・drawdown: 閾値(%) / above・below: 価格 / breakout: 未使用
+    window_minutes: int = 0 # change・drawdown・breakout で使用
+
+    def describe(self) -> str:
+        if self.kind == KIND_CHANGE:
+            return f"{self.window_minutes}分で±{self.value}%"
+        if self.kind == KIND_DRAWDOWN:
+            return f"{self.window_minutes}分高値から-{self.value}%"
+        if self.kind == KIND_BREAKOUT:
+            return f"{self.window_minutes}分高値を更新"
+        if self.kind == KIND_ABOVE:
+            return f"${self.value:.8g} 上抜け"
+        return f"${self.value:.8g} 下抜け"
+
+@dataclass
+class AlertRule:
+    rule_id: int
+    target_id: int # channel_id または user_id
+    is_user: bool
+    symbol: str
+    conditions: List[RuleCondition] = field(default_factory=list)
+    mode: str = MODE_ANY
+    enabled: bool = True
+    rearm_ratio: float = DEFAULT_REARM_RATIO # 変動率条件の再通知判定
+
+    @property
+    def state_key(self) -> str:
+        return f"r:{self.rule_id}"
+
+    def describe(self) -> str:
+        joiner = " かつ " if self.mode == MODE_ALL else " または "
+        return joiner.join(c.describe() for c in self.conditions)
+
+@dataclass
+class RuleMatch:
+    rule: AlertRule
+    matched: List[RuleCondition]
+    # 発動した change 条件の (N分前価格, 変動率)
+    changes: Dict[int, Tuple[float, float]] = field(default_factory=dict)
+    # 発動した drawdown・breakout 条件の時間窓の高値・安値
+    extremes: Dict[int, WindowExtremes] = field(default_factory=dict)
+
+def parse_conditions(text: str) -> List[RuleCondition]:
+    """
+    条件文字列を解析します。空白またはカンマ区切り。
+    例: "above:0.0002 below:0.0001 change:5:2"
+      above:<価格>  価格が上抜けたとき
+      below:<価格>  価格が下抜けたとき
+      change:<分>:<%>  N分間で±X%以上動いたとき
+      drawdown:<分>:<%>  N分間の高値から X% 以上下落したとき
+      breakout:<分>  N分間の高値を更新したとき
+    """
+    conditions = []
+    for token in re.split(r"[\s,]+", text.strip()):
+        if not token:
+            continue
+        parts = token.lower().split(":")
+        try:
+            if parts[0] in LEVEL_KINDS and len(parts) == 2:
+                price = float(parts[1])
+                if price <= 0:
+                    raise ValueError
+                conditions.append(RuleCondition(kind=parts[0], value=price))
+            elif parts[0] in (KIND_CHANGE, KIND_DRAWDOWN) and len(parts) == 3:
+                window = int(parts[1])
+                threshold = float(parts[2].rstrip("%"))
+                if not (1 <= window <= 60) or threshold <= 0:
+                    raise ValueError
+                conditions.append(RuleCondition(kind=parts[0], value=threshold, window_minutes=window))
+            elif parts[0] == KIND_BREAKOUT and len(parts) == 2:
+                window = int(parts[1])
+                if not (1 <= window <= 60):
+                    raise ValueError
+                conditions.append(RuleCondition(kind=KIND_BREAKOUT, value=0.0, window_minutes=window))
+            else:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"条件 `{token}` を解釈できません。例: `above:0.0002` `below:0.0001` `change:5:2` `drawdown:30:5` `breakout:60`")
+    if not conditions:
+        raise ValueError("条件を1つ以上指定してください。")
+    return conditions
+
+class RuleEngine:
+    def __init__(self, path: str = RULES_FILE):
+        self.path = path
+        # rule_id -> AlertRule
+        self.rules: Dict[int, AlertRule] = {}
+        self.next_id = 1
+        # ルールの追加・削除のたびに増える（監視側の索引の作り直し判定用）
+        self.version = 0
+
+        # 価格水準インデックス: symbol -> kind -> [(価格, rule_id, 条件index)] (価格の昇順)
+        self._levels: Dict[str, Dict[str, List[Tuple[float, int, int]]]] = {}
+        # 毎tick評価が必要なルール（時間窓を使う条件を含むもの）: symbol -> {rule_id}
+        self._scan_rules: Dict[str, Set[int]] = {}
+
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                self.next_id = data.get("next_id", 1)
+                for rule_data in data.get("rules", []):
+                    rule = AlertRule(
+                        rule_id=int(rule_data["rule_id"]),
+                        target_id=int(rule_data["target_id"]),
+                        is_user=rule_data.get("is_user", False),
+                        symbol=rule_data["symbol"],
+                        conditions=[RuleCondition(**c) for c in rule_data.get("conditions", [])],
+                        mode=rule_data.get("mode", MODE_ANY),
+                        enabled=rule_data.get("enabled", True),
+                        rearm_ratio=rule_data.get("rearm_ratio", DEFAULT_REARM_RATIO)
+                    )
+                    self.rules[rule.rule_id] = rule
+                    self._index(rule)
+                    self.next_id = max(self.next_id, rule.rule_id + 1)
+        except Exception as e:
+            print(f"Error loading rules: {e}")
+
+    def save(self):
+        data = {
+            "next_id": self.next_id,
+            "rules": [asdict(rule) for rule in self.rules.values()]
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            print(f"Error saving rules: {e}")
+
+    def _index(self, rule: AlertRule):
+        if not rule.enabled:
+            return
+        has_level = False
+        for idx, cond in enumerate(rule.conditions):
+            if cond.kind in LEVEL_KINDS:
+                has_level = True
+                levels = self._levels.setdefault(rule.symbol, {}).setdefault(cond.kind, [])
+                insort(levels, (cond.value, rule.rule_id, idx))
+        # AND条件で水準条件を含むルールは、水準を跨いだtickにしか発動しないので走査不要（変動率は跨いだ時点の値で判定）
+        has_window = any(c.kind in WINDOW_KINDS for c in rule.conditions)
+        if has_window and not (rule.mode == MODE_ALL and has_level):
+            self._scan_rules.setdefault(rule.symbol, set()).add(rule.rule_id)
+
+    def _unindex(self, rule: AlertRule):
+        for idx, cond in enumerate(rule.conditions):
+            if cond.kind in LEVEL_KINDS:
+                levels = self._levels.get(rule.symbol, {}).get(cond.kind, [])
+                entry = (cond.value, rule.rule_id, idx)
+                i = bisect_left(levels, entry)
+                if i < len(levels) and levels[i] == entry:
+                    levels.pop(i)
+        self._scan_rules.get(rule.symbol, set()).discard(rule.rule_id)
+
+    def add_rule(self, target_id: int, is_user: bool, symbol: str, conditions: List[RuleCondition],
+                 mode: str = MODE_ANY, rearm_ratio: float = DEFAULT_REARM_RATIO) -> AlertRule:
+        if len(self.get_rules(target_id, is_user)) >= MAX_RULES_PER_TARGET:
+            raise ValueError(f"登録できるルールは最大{MAX_RULES_PER_TARGET}件です。")
+        rule = AlertRule(
+            rule_id=self.next_id,
+            target_id=target_id,
+            is_user=is_user,
+            symbol=symbol,
+            conditions=conditions,
+            mode=mode,
+            rearm_ratio=rearm_ratio
+        )
+        self.next_id += 1
+        self.rules[rule.rule_id] = rule
+        self._index(rule)
+        self.version += 1
+        self.save()
+        return rule
+
+    def remove_rule(self, rule_id: int, target_id: int, is_user: bool) -> bool:
+        rule = self.rules.get(rule_id)
+        if not rule or rule.target_id != target_id or rule.is_user != is_user:
+            return False
+        self._unindex(rule)
+        del self.rules[rule_id]
+        self.version += 1
+        self.save()
+        return True
+
+    def get_rules(self, target_id: int, is_user: bool) -> List[AlertRule]:
+        return [r for r in self.rules.values() if r.target_id == target_id and r.is_user == is_user]
+
+    def symbols(self) -> Set[str]:
+        return {r.symbol for r in self.rules.values() if r.enabled}
+
+    def extreme_windows(self) -> Dict[str, Set[int]]:
+        """
+        高値・安値の集計が必要な symbol -> 時間窓（drawdown・breakout 条件）。
+        """
+        windows: Dict[str, Set[int]] = {}
+        for rule in self.rules.values():
+            if not rule.enabled:
+                continue
+            for cond in rule.conditions:
+                if cond.kind in (KIND_DRAWDOWN, KIND_BREAKOUT):
+                    windows.setdefault(rule.symbol, set()).add(cond.window_minutes)
+        return windows
+
+    def crossed_levels(self, symbol: str, prev_price: float, current_price: float) -> Dict[int, Set[int]]:
+        """
+        前回価格から今回価格への移動で跨いだ水準を二分探索で求めます。
+        戻り値: rule_id -> 跨いだ条件indexの集合
+        """
+        crossed: Dict[int, Set[int]] = {}
+        index = self._levels.get(symbol)
+        if not index or prev_price == current_price:
+            return crossed
+
+        if current_price > prev_price:
+            # prev < level <= current を上抜け
+            levels = index.get(KIND_ABOVE, [])
+            lo = bisect_right(levels, (prev_price, float("inf")))
+            hi = bisect_right(levels, (current_price, float("inf")))
+        else:
+            # current <= level < prev を下抜け
+            levels = index.get(KIND_BELOW, [])
+            lo = bisect_left(levels, (current_price,))
+            hi = bisect_left(levels, (prev_price,))
+
+        for _, rule_id, idx in levels[lo:hi]:
+            crossed.setdefault(rule_id, set()).add(idx)
+        return crossed
+
+    def evaluate(self, symbol: str, prev_price: Optional[float], current_price: float,
+                 get_change: Callable[[int], Optional[Tuple[float, float]]],
+                 state: AlertStateTracker,
+                 get_extremes: Callable[[int], Optional[WindowExtremes]] = lambda window: None) -> List[RuleMatch]:
+        """
+        1シンボル分のルールを評価し、今回新たに発動したものを返します。
+        get_change(window_minutes) は (N分前価格, 変動率%) を返す関数（PriceMonitor._get_change）。
+        get_extremes(window_minutes) は時間窓の高値・安値（PriceMonitor.extremes）を返す関数。
+
+        ルールの成立状態は state でエッジ判定し、成立し続けている間は再発動しません。
+        水準の跨ぎはそれ自体が新しい事象なので、成立中でも跨いだtickには発動します。
+        """
+        crossed = self.crossed_levels(symbol, prev_price, current_price) if prev_price is not None else {}
+        candidates = set(crossed) | self._scan_rules.get(symbol, set())
+
+        matches = []
+        change_cache: Dict[int, Optional[Tuple[float, float]]] = {}
+        for rule_id in candidates:
+            rule = self.rules.get(rule_id)
+            if rule is None or not rule.enabled:
+                continue
+
+            matched = []
+            changes = {}
+            extremes = {}
+            level_crossed = False
+            # AND条件で水準条件を含むルールは跨いだtickにしか評価されず、途中で状態を再武装できないため、
+            # 変動率・下落率はヒステリシスなしで今回の値そのものを判定する
+            stateless = rule.mode == MODE_ALL and any(c.kind in LEVEL_KINDS for c in rule.conditions)
+            for idx, cond in enumerate(rule.conditions):
+                if cond.kind == KIND_CHANGE:
+                    if cond.window_minutes not in change_cache:
+                        change_cache[cond.window_minutes] = get_change(cond.window_minutes)
+                    change = change_cache[cond.window_minutes]
+                    if change is None:
+                        continue
+                    if stateless:
+                        active_cond = abs(change[1]) >= cond.value
+                    else:
+                        # ヒステリシス付きで「成立中」かどうかを判定
+                        cond_key = f"{rule.state_key}:{idx}"
+                        state.update(cond_key, change[1], cond.value, rule.rearm_ratio)
+                        active_cond = state.is_fired(cond_key)
+                    if active_cond:
+                        matched.append(cond)
+                        changes[cond.window_minutes] = change
+                elif cond.kind in (KIND_DRAWDOWN, KIND_BREAKOUT):
+                    window = get_extremes(cond.window_minutes)
+                    if window is None or window.high is None:
+                        continue
+                    if cond.kind == KIND_DRAWDOWN:
+                        drawdown = window.drawdown_percent(current_price)
+                        if stateless:
+                            active_cond = drawdown >= cond.value
+                        else:
+                            # 高値から戻すまで（閾値×rearm_ratio未満）成立中とみなす
+                            cond_key = f"{rule.state_key}:{idx}"
+                            state.update(cond_key, drawdown, cond.value, rule.rearm_ratio)
+                            active_cond = state.is_fired(cond_key)
+                    else:
+                        active_cond = window.breakout
+                    if active_cond:
+                        matched.append(cond)
+                        extremes[cond.window_minutes] = window
+                elif idx in crossed.get(rule_id, ()):
+                    matched.append(cond)
+                    level_crossed = True
+
+            if rule.mode == MODE_ALL:
+                active = len(matched) == len(rule.conditions)
+            else:
+                active = bool(matched)
+
+            # ルールの成立状態は毎回記録する（跨ぎで発動した後、成立が続く間に再発動しないように）
+            rising = state.edge(rule.state_key, active)
+            if rising or (active and level_crossed):
+                matches.append(RuleMatch(rule=rule, matched=matched, changes=changes, extremes=extremes))
+        return matches
+
+    def owns_state_key(self, key: str) -> bool:
+        """
+        ルール用の状態キー (r:<rule_id>...) が現存するルールのものか判定します。
+        """
+        try:
+            return int(key.split(":")[1]) in self.rules
+        except (IndexError, ValueError):
+            return False
+
+rule_engine = RuleEngine()
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set
+from bot.mexc_api import MexcApi, mexc_api
+
+DEFAULT_SYMBOL = "114514USDT"
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class SymbolCatalog:
+    """
+    MEXCの全シンボルを exchangeInfo から一括で読み込み、メモリ上で検索できるようにします。
+    存在確認は集合でO(1)、オートコンプリートは前方一致（二分探索）と部分一致（トライグラム索引）で行います。
+    """
+    def __init__(self, api: MexcApi = mexc_api, refresh_interval: int = 3600):
+        self.api = api
+        self.refresh_interval = refresh_interval
+
+        self.symbols: Set[str] = set()
+        # symbol -> (baseAsset, quoteAsset)
+        self.assets: Dict[str, tuple] = {}
+        self._sorted: List[str] = []
+        # トライグラム -> シンボル一覧（短い順）。上位から走査して必要件数で打ち切れるようにする
+        self._trigrams: Dict[str, List[str]] = {}
+        self.loaded_at: float = 0
+
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.symbols)
+
+    def load(self, entries: Iterable[Dict]):
+        symbols = set()
+        assets = {}
+        for entry in entries:
+            symbol = str(entry.get("symbol", "")).upper()
+            if not symbol:
+                continue
+            symbols.add(symbol)
+            assets[symbol] = (entry.get("baseAsset", ""), entry.get("quoteAsset", ""))
+
+        trigrams: Dict[str, List[str]] = {}
+        for symbol in sorted(symbols, key=lambda s: (len(s), s)):
+            for gram in _trigrams(symbol):
+                trigrams.setdefault(gram, []).append(symbol)
+
+        # 読み込み完了後にまとめて差し替える（検索中に中途半端な状態を見せない）
+        self.symbols = symbols
+        self.assets = assets
+        self._sorted = sorted(symbols)
+        self._trigrams = trigrams
+        self.loaded_at = time.time()
+
+    async def refresh(self) -> bool:
+        entries = await self.api.get_exchange_info()
+        if not entries:
+            # 失敗時は前回のカタログを使い続ける
+            return False
+        self.load(entries)
+        print(f"Symbol catalog loaded: {len(self.symbols)} symbols")
+        return True
+
+    def start(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            ok = await self.refresh()
+            # 失敗時は早めに再試行
+            await asyncio.sleep(self.refresh_interval if ok else 60)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self.symbols
+
+    async def exists(self, symbol: str) -> bool:
+        """
+        シンボルの存在確認。カタログ未読み込みの場合のみ価格APIで確認します。
+        """
+        if self.loaded:
+            return symbol in self
+        return await self.api.check_symbol_exists(symbol)
+
+    def by_quote(self, quote: str) -> List[str]:
+        quote = quote.upper()
+        return [s for s in self._sorted if self.assets.get(s, ("", ""))[1].upper() == quote]
+
+    def search(self, query: str, limit: int = 25) -> List[str]:
+        """
+        オートコンプリート用の候補を返します。前方一致を優先し、足りなければ部分一致で補います。
+        """
+        query = query.strip().upper()
+        if not query:
+            results = [DEFAULT_SYMBOL] if DEFAULT_SYMBOL in self.symbols else []
+            results += [s for s in self._sorted[:limit] if s != DEFAULT_SYMBOL]
+            return results[:limit]
+
+        results = []
+        i = bisect_left(self._sorted, query)
+        while i < len(self._sorted) and len(results) < limit and self._sorted[i].startswith(query):
+            results.append(self._sorted[i])
+            i += 1
+
+        if len(results) < limit and len(query) >= 3:
+            # 最も出現の少ないトライグラムの一覧だけを短い順に走査する
+            rarest = min(_trigrams(query), key=lambda g: len(self._trigrams.get(g, ())))
+            seen = set(results)
+            for symbol in self._trigrams.get(rarest, ()):
+                if query in symbol and symbol not in seen:
+                    results.append(symbol)
+                    if len(results) >= limit:
+                        break
+
+        return results
+
+symbol_catalog = SymbolCatalog()
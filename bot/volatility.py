@@ -0,0 +1,96 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Mapping, Optional, Set, Tuple
+
+ALERT_MODE_PERCENT = "percent" # 変動率が閾値(%)を超えたら通知
+ALERT_MODE_SIGMA = "sigma"     # 変動率が平常時の k σ を超えたら通知
+DEFAULT_SIGMA_K = 3.0
+
+# zスコアを使うのに必要な最小サンプル数（起動直後のσが小さすぎて誤発火しないように）
+MIN_SAMPLES = 20
+
+class RollingStats:
+    """
+    時間窓内の値の平均・分散を Welford 法で逐次更新します。
+    追加も期限切れの削除も O(1) で、履歴を走査し直しません。
+    """
+    def __init__(self):
+        self.samples: Deque[Tuple[float, float]] = deque()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, ts: float, value: float):
+        self.samples.append((ts, value))
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def evict(self, cutoff: float):
+        while self.samples and self.samples[0][0] < cutoff:
+            _, value = self.samples.popleft()
+            if self.n <= 1:
+                self.n, self.mean, self.m2 = 0, 0.0, 0.0
+                continue
+            # Welford の逆操作
+            self.n -= 1
+            old_mean = self.mean
+            self.mean -= (value - old_mean) / self.n
+            self.m2 -= (value - self.mean) * (value - old_mean)
+        if self.m2 < 0:
+            # 丸め誤差で負になった場合だけ全件から計算し直す
+            self._recompute()
+
+    def _recompute(self):
+        values = [v for _, v in self.samples]
+        self.n = len(values)
+        self.mean = sum(values) / self.n if values else 0.0
+        self.m2 = sum((v - self.mean) ** 2 for v in values)
+
+    @property
+    def std(self) -> Optional[float]:
+        if self.n < 2:
+            return None
+        return math.sqrt(self.m2 / (self.n - 1))
+
+    def zscore(self, value: float, min_samples: int = MIN_SAMPLES) -> Optional[float]:
+        std = self.std
+        if self.n < min_samples or not std:
+            return None
+        return (value - self.mean) / std
+
+class VolatilityTracker:
+    """
+    シンボル・時間窓ごとに「N分変動率(%)」の直近 horizon 秒の平均と標準偏差を保持します。
+    価格履歴に1件追加されるたびに observe() で1サンプル追加・期限切れを削除します。
+    """
+    def __init__(self, horizon: float = 3600):
+        self.horizon = horizon
+        # symbol -> 集計する時間窓
+        self.windows: Dict[str, Set[int]] = {}
+        self.stats: Dict[Tuple[str, int], RollingStats] = {}
+
+    def set_windows(self, windows: Mapping[str, Set[int]]):
+        self.windows = {symbol: set(ws) for symbol, ws in windows.items() if ws}
+        for key in [k for k in self.stats if k[1] not in self.windows.get(k[0], ())]:
+            del self.stats[key]
+
+    def reset(self, symbol: str):
+        for key in [k for k in self.stats if k[0] == symbol]:
+            del self.stats[key]
+
+    def observe(self, symbol: str, window: int, ts: float, change_percent: Optional[float]):
+        stats = self.stats.get((symbol, window))
+        if stats is None:
+            stats = self.stats[(symbol, window)] = RollingStats()
+        if change_percent is not None:
+            stats.push(ts, change_percent)
+        stats.evict(ts - self.horizon)
+
+    def get(self, symbol: str, window: int) -> Optional[RollingStats]:
+        return self.stats.get((symbol, window))
+
+    def zscore(self, symbol: str, window: int, change_percent: float) -> Optional[float]:
+        stats = self.stats.get((symbol, window))
+        return stats.zscore(change_percent) if stats else None
@@ -1,16 +1,28 @@
 import asyncio
 from bot.mexc_api import MexcApi
+from bot.symbol_catalog import SymbolCatalog
 
 async def main():
     api = MexcApi()
+    catalog = SymbolCatalog(api)
     
     symbols = ["USDTJPY", "USDCJPY", "BTCJPY"]
     
+    # 全シンボル情報と全価格をそれぞれ1リクエストで取得して照合する
     print("Checking JPY pairs on MEXC...")
+    if not await catalog.refresh():
+        print("Failed to load symbol catalog.")
+        await api.close()
+        return
+    prices = await api.get_all_prices()
+
     for symbol in symbols:
-        exists = await api.check_symbol_exists(symbol)
-        price = await api.get_price(symbol) if exists else "N/A"
+        exists = symbol in catalog
+        price = prices.get(symbol, "N/A") if exists else "N/A"
         print(f"Symbol: {symbol}, Exists: {exists}, Price: {price}")
+
+    jpy_pairs = catalog.by_quote("JPY")
+    print(f"All JPY-quoted pairs ({len(jpy_pairs)}): {', '.join(jpy_pairs) or 'none'}")
     
     await api.close()
 